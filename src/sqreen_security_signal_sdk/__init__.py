@@ -8,10 +8,12 @@
 from .__about__ import __version__
 from .client import Client
 from .compat_model import Signal, SignalType, Trace
+from .transport import SharedTransport
 
 __all__ = [
     "__version__",
     "Client",
+    "SharedTransport",
     "Signal",
     "SignalType",
     "Trace",
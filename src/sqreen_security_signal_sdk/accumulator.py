@@ -6,12 +6,12 @@
 #
 import sys
 import threading
-import time
 
 from .compat_model import Batch
+from .utils import monotonic_ms
 
 if sys.version_info >= (3, 5):
-    from typing import Optional
+    from typing import Callable, Iterable, List, Optional
 
     from .compat_model import AnySignal
 
@@ -21,16 +21,27 @@ class BatchingAccumulator(object):
 
     :param max_batch_size: (optional) Maximum number of items in the batch (default to 50).
     :param linger_time: (optional) Maximum age of a non-empty batch in seconds (default to 60s).
+    :param clock: (optional) Monotonic clock in milliseconds, such as a CoarseClock.
     """
 
-    def __init__(self, max_batch_size=50, linger_time=60):
-        # type: (int, float) -> None
+    def __init__(self, max_batch_size=50, linger_time=60, clock=None):
+        # type: (int, float, Optional[Callable[[], int]]) -> None
         self.max_batch_size = max_batch_size
         self.linger_ms = int(linger_time * 1000)
+        self.clock = clock or monotonic_ms
         self.batch = Batch()
         self.batch_creation_time = 0
         self.batch_lock = threading.RLock()
 
+    def configure(self, max_batch_size=None, linger_time=None):
+        # type: (Optional[int], Optional[float]) -> None
+        """Change the limits of the batches, starting with the current one."""
+        with self.batch_lock:
+            if max_batch_size is not None:
+                self.max_batch_size = max_batch_size
+            if linger_time is not None:
+                self.linger_ms = int(linger_time * 1000)
+
     def add(self, signal):  # type: (AnySignal) -> Optional[Batch]
         """Add a signal to the current batch and flush it if needed."""
         with self.batch_lock:
@@ -39,6 +50,16 @@ class BatchingAccumulator(object):
             self.batch.append(signal)
             return self.flush(soft=True)
 
+    def extend(self, signals):  # type: (Iterable[AnySignal]) -> List[Batch]
+        """Add signals to the current batch and return the batches to flush."""
+        batches = []
+        with self.batch_lock:
+            for signal in signals:
+                batch = self.add(signal)
+                if batch:
+                    batches.append(batch)
+        return batches
+
     def flush(self, soft=False):  # type: (bool) -> Optional[Batch]
         """Flush the current batch if not empty.
 
@@ -56,6 +77,5 @@ class BatchingAccumulator(object):
                 return batch
             return None
 
-    @staticmethod
-    def _current_time_ms():  # type: () -> int
-        return int(time.time() * 1000)
+    def _current_time_ms(self):  # type: () -> int
+        return self.clock()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+import sys
+import threading
+
+if sys.version_info >= (3, 5):
+    from typing import Optional
+
+    from .accumulator import BatchingAccumulator
+
+
+class AdaptiveBatchController(object):
+    """Tune the batch size and linger time of an accumulator at runtime.
+
+    Each sent batch is observed with its send time (encoding and response)
+    and the number of batches waiting for a worker, not counting the ones
+    being sent:
+
+    - when sends get slower than `target_latency`, batches are halved;
+    - when batches queue up, full batches are doubled to send more signals
+      per request;
+    - otherwise full batches grow slowly while sends stay fast.
+
+    The linger time leaves room in `max_delay` for the queued batches and the
+    send time, so that signals are delivered within it.
+
+    The bounds default to include the starting batch size and linger time of
+    the accumulator, and a ValueError is raised when they are set without
+    including them.
+
+    :param accumulator: Accumulator to tune.
+    :param min_batch_size: (optional) Minimum number of items per batch (default to 10).
+    :param max_batch_size: (optional) Maximum number of items per batch (default to 500).
+    :param min_linger_time: (optional) Minimum age of a batch in seconds (default to 0.1s).
+    :param max_linger_time: (optional) Maximum age of a batch in seconds (default to 60s).
+    :param target_latency: (optional) Target send time of a batch in seconds (default to 1s).
+    :param max_delay: (optional) Target delivery delay of a signal in seconds (default to 60s).
+    :param max_queue_depth: (optional) Number of batches waiting for a worker above which full batches grow faster (default to 1).
+    """
+
+    # Weight of the last observation in the average send time.
+    smoothing = 0.3
+    # Items added to full batches when sends are fast.
+    growth_step = 10
+
+    def __init__(self, accumulator, min_batch_size=None, max_batch_size=None,
+                 min_linger_time=None, max_linger_time=None, target_latency=1,
+                 max_delay=60, max_queue_depth=1):
+        # type: (BatchingAccumulator, Optional[int], Optional[int], Optional[float], Optional[float], float, float, int) -> None
+        batch_size = accumulator.max_batch_size
+        linger_time = accumulator.linger_ms / 1000.0
+        if min_batch_size is None:
+            min_batch_size = min(10, batch_size)
+        if max_batch_size is None:
+            max_batch_size = max(500, batch_size)
+        if min_linger_time is None:
+            min_linger_time = min(0.1, linger_time)
+        if max_linger_time is None:
+            max_linger_time = max(60, linger_time)
+        if not min_batch_size <= batch_size <= max_batch_size:
+            raise ValueError("batch size {} out of the bounds {}-{}".format(
+                batch_size, min_batch_size, max_batch_size))
+        if not min_linger_time <= linger_time <= max_linger_time:
+            raise ValueError("linger time {}s out of the bounds {}-{}s".format(
+                linger_time, min_linger_time, max_linger_time))
+        self.accumulator = accumulator
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_linger_time = min_linger_time
+        self.max_linger_time = max_linger_time
+        self.target_latency = target_latency
+        self.max_delay = max_delay
+        self.max_queue_depth = max_queue_depth
+        self.latency = None  # type: Optional[float]
+        self.lock = threading.Lock()
+
+    def observe(self, batch_size, latency, queue_depth):  # type: (int, float, int) -> None
+        """Record the send time of a batch and tune the accumulator."""
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = self.smoothing * latency + (1 - self.smoothing) * self.latency
+
+            size = self.accumulator.max_batch_size
+            full = batch_size >= size
+            if self.latency > self.target_latency:
+                size //= 2
+            elif full and queue_depth > self.max_queue_depth:
+                size *= 2
+            elif full and self.latency < self.target_latency / 2.0:
+                size += self.growth_step
+            size = max(self.min_batch_size, min(self.max_batch_size, size))
+
+            linger_time = self.max_delay - self.latency * (queue_depth + 1)
+            linger_time = max(self.min_linger_time, min(self.max_linger_time, linger_time))
+
+            self.accumulator.configure(max_batch_size=size, linger_time=linger_time)
@@ -4,18 +4,29 @@
 #
 #     https://www.sqreen.io/terms.html
 #
+import logging
 import sys
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 from .__about__ import __version__
 from .accumulator import BatchingAccumulator
+from .adaptive import AdaptiveBatchController
 from .compat_model import Signal, SignalType, Trace
-from .sender import SyncSender
+from .lanes import Lane
+from .sender import SyncSender, serialize_json
+from .trace_builder import TraceBuilder
+from .utils import CoarseClock, RawJSON, cap_payload, monotonic_ms
 
 if sys.version_info >= (3, 5):
-    from typing import Any, Optional
+    from typing import Any, Dict, Iterable, List, Mapping, Optional
 
-    from .compat_model import AnySignal
+    from .compat_model import AnySignal, Batch
+    from .sender import BaseSender
+    from .transport import SharedTransport
+
+
+LOGGER = logging.getLogger(__name__)
 
 
 class SyncClient(object):
@@ -28,30 +39,152 @@ class SyncClient(object):
     :param interval_batch: (optional) Interval at which non-empty batch should be sent (default to 60s).
     :param session_token: (optional) When true, token is a session token instead of an API token.
     :param base_url: (optional) Set a different ingestion API URL.
+    :param lanes: (optional) Additional batching lanes, mapping a lane name to
+    its ``max_batch_size``, ``linger_time``, ``max_workers``, ``adaptive``
+    and ``priority`` settings.
+    :param payload_limits: (optional) Limit the size of signal and trace
+    payloads with the ``max_string_length``, ``max_items`` and ``max_depth``
+    settings, the number of truncations is counted in ``truncations``.
+    :param prewarm: (optional) Open the connections in the background when the client starts.
+    :param keepalive_interval: (optional) Reopen the connections after this
+    many seconds of inactivity, before the server closes them.
+    :param spill_path: (optional) File where the signals that could not be
+    sent when closing the client are appended, one JSON document per line.
+    :param transport: (optional) Send the batches with the connections and
+    worker threads of a SharedTransport, instead of the client's own ones.
+    The ``base_url``, ``proxy_url``, ``keepalive_interval`` and
+    ``encoding_processes`` settings are then those of the transport.
+    :param encoding_processes: (optional) Number of processes serializing the
+    batches, to keep the JSON encoding from holding the GIL of the application.
+    :param adaptive_batching: (optional) Tune the batch size and interval of
+    the default lane at runtime with these AdaptiveBatchController settings.
+    :param clock_resolution: (optional) Refresh interval in seconds of a
+    coarse clock read by the accumulators, and timestamping the signals and
+    traces recorded without a ``time``, instead of reading the system clock.
+
+    Signals are sent through the default lane unless a ``lane`` is given when
+    recording them. The ``priority`` lane sends its signals right away, on
+    workers and connections that are not shared with the other lanes. With
+    a SharedTransport, the lanes with the ``priority`` setting are sent by
+    the priority workers and connections of the transport, ahead of the
+    batches taking turns with the other clients.
     """
 
     accumulator_class = BatchingAccumulator
+    controller_class = AdaptiveBatchController
+    lane_class = Lane
     sender_class = SyncSender
+    trace_builder_class = TraceBuilder
 
     user_agent = "sqreen-python-security-signal-sdk/{}".format(__version__)
     max_workers = 2
 
+    default_lane = "default"
+    default_lanes = {
+        "priority": dict(max_batch_size=1, linger_time=0, max_workers=1, priority=True),
+    }  # type: Mapping[str, Mapping[str, Any]]
+
     def __init__(self, token, app_name=None, proxy_url=None, max_batch_size=50,
-                 interval_batch=60, session_token=False, base_url=None):
-        # type: (str, Optional[str], Optional[str], int, float, bool, Optional[str]) -> None
+                 interval_batch=60, session_token=False, base_url=None, lanes=None,
+                 payload_limits=None, prewarm=False, keepalive_interval=None,
+                 spill_path=None, transport=None, encoding_processes=None,
+                 adaptive_batching=None, clock_resolution=None):
+        # type: (str, Optional[str], Optional[str], int, float, bool, Optional[str], Optional[Mapping[str, Mapping[str, Any]]], Optional[Mapping[str, int]], bool, Optional[float], Optional[str], Optional[SharedTransport], Optional[int], Optional[Mapping[str, Any]], Optional[float]) -> None
+
+        if transport is not None:
+            transport_options = [
+                name for name, value in (
+                    ("base_url", base_url), ("proxy_url", proxy_url),
+                    ("keepalive_interval", keepalive_interval),
+                    ("encoding_processes", encoding_processes))
+                if value is not None
+            ]
+            if transport_options:
+                raise ValueError("{} must be set on the shared transport".format(
+                    ", ".join(transport_options)))
+
+        unknown_limits = set(payload_limits or {}).difference(
+            ("max_string_length", "max_items", "max_depth"))
+        if unknown_limits:
+            raise ValueError("unknown payload limits: {}".format(
+                ", ".join(sorted(unknown_limits))))
+
+        headers = self.build_headers(token, app_name=app_name, session_token=session_token)
+
+        lanes_options = dict(self.default_lanes)
+        lanes_options.update(lanes or {})
+        lanes_options[self.default_lane] = dict(
+            max_batch_size=max_batch_size, linger_time=interval_batch,
+            max_workers=self.max_workers, adaptive=adaptive_batching)
+        # One connection per worker so that lanes never wait for each other.
+        max_pool_size = sum(options.get("max_workers", 1) for options in lanes_options.values())
+
+        self.closed = False
+        self.spill_path = spill_path
+        # Batches failing after close are spilled from the worker threads.
+        self.spill_lock = threading.Lock()
+        self.payload_limits = dict(payload_limits or {})
+        self.truncations = 0
+        self.truncations_lock = threading.Lock()
+
+        self.clock = None  # type: Optional[CoarseClock]
+        if clock_resolution is not None:
+            self.clock = CoarseClock(resolution=clock_resolution)
+            self.clock.start()
 
-        headers = {"User-Agent": self.user_agent}
+        self.encoding_executor = None  # type: Optional[ProcessPoolExecutor]
+        if encoding_processes:
+            self.encoding_executor = ProcessPoolExecutor(max_workers=encoding_processes)
+
+        self.transport = transport
+        if transport is not None:
+            self.sender = transport.sender_for(headers)  # type: BaseSender
+        else:
+            self.sender = self.sender_class(
+                base_url=base_url, proxy_url=proxy_url, headers=headers,
+                max_pool_size=max_pool_size, encoding_executor=self.encoding_executor)
+        self.lanes = {
+            name: self._create_lane(**options)
+            for name, options in lanes_options.items()
+        }
+        self.accumulator = self.lanes[self.default_lane].accumulator
+        self.executor = self.lanes[self.default_lane].executor
+
+        if prewarm:
+            self.executor.submit(self.sender.warm_up)
+        if keepalive_interval is not None:
+            self.sender.start_keepalive(keepalive_interval)
+
+    @classmethod
+    def build_headers(cls, token, app_name=None, session_token=False):
+        # type: (str, Optional[str], bool) -> Dict[str, str]
+        """Return the headers authenticating the requests of a client."""
+        headers = {"User-Agent": cls.user_agent}
         if session_token:
             headers["X-Session-Key"] = token
         else:
             headers["X-Api-Key"] = token
             if app_name is not None:
                 headers["X-App-Name"] = app_name
+        return headers
 
-        self.sender = self.sender_class(base_url=base_url, proxy_url=proxy_url, headers=headers)
-        self.accumulator = self.accumulator_class(
-            max_batch_size=max_batch_size, linger_time=interval_batch)
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+    def _create_lane(self, max_batch_size=50, linger_time=60, max_workers=1, adaptive=None,
+                     priority=False):
+        # type: (int, float, int, Optional[Mapping[str, Any]], bool) -> Lane
+        accumulator = self.accumulator_class(
+            max_batch_size=max_batch_size, linger_time=linger_time,
+            clock=self.clock)
+        controller = None
+        if adaptive is not None:
+            controller = self.controller_class(accumulator, **adaptive)
+        sender = self.sender
+        executor = None
+        if self.transport is not None:
+            if priority:
+                sender = self.transport.sender_for(self.sender.headers, priority=True)
+            executor = self.transport.executor_for(priority=priority)
+        return self.lane_class(sender, accumulator, max_workers=max_workers,
+                               executor=executor, controller=controller)
 
     def point(self, signal_name, payload, **properties):  # type: (str, Any, **Any) -> None
         """Record a point signal to be sent."""
@@ -64,21 +197,112 @@ class SyncClient(object):
         return self.signal(signal_name, payload, **properties)
 
     def signal(self, signal_name, payload, **properties):  # type: (str, Any, **Any) -> None
-        """Record a signal to be sent."""
+        """Record a signal to be sent.
+
+        :param lane: (optional) Name of the lane sending the signal.
+        """
+        lane = properties.pop("lane", None)
+        if self.clock is not None and "time" not in properties:
+            properties["time"] = self.clock.utcnow()
+        if self.payload_limits:
+            payload = self._cap_payload(payload)
         signal = dict(signal_name=signal_name, payload=payload)  # type: Signal
         signal.update(properties)  # type: ignore
-        return self._add_and_send(signal)
+        return self._add_and_send(signal, lane=lane)
 
     def trace(self, data, **properties):  # type: (Any, **Any) -> None
-        """Record a trace to be sent."""
+        """Record a trace to be sent.
+
+        :param lane: (optional) Name of the lane sending the trace.
+        """
+        lane = properties.pop("lane", None)
+        if self.clock is not None and "time" not in properties:
+            properties["time"] = self.clock.utcnow()
         trace = dict(data=data)  # type: Trace
         trace.update(properties)  # type: ignore
-        return self._add_and_send(trace)
+        if self.payload_limits:
+            self._cap_trace(trace)
+        return self._add_and_send(trace, lane=lane)
+
+    def _cap_payload(self, payload):  # type: (Any) -> Any
+        payload, truncations = cap_payload(
+            payload, reencode=True, **self.payload_limits)
+        if truncations:
+            with self.truncations_lock:
+                self.truncations += truncations
+        return payload
 
-    def _add_and_send(self, data):  # type: (AnySignal) -> None
-        batch = self.accumulator.add(data)
-        if batch:
-            self.executor.submit(self.sender.send_batch, batch)
+    def _cap_trace(self, trace):  # type: (Trace) -> None
+        if "payload" in trace:
+            trace["payload"] = self._cap_payload(trace["payload"])
+        if isinstance(trace["data"], (list, tuple)):
+            data = []
+            for signal in trace["data"]:
+                if isinstance(signal, dict) and "payload" in signal:
+                    signal = dict(signal, payload=self._cap_payload(signal["payload"]))
+                data.append(signal)
+            trace["data"] = data
+
+    def trace_builder(self, max_signals=100, max_size=256 * 1024, **properties):
+        # type: (int, int, **Any) -> TraceBuilder
+        """Return a builder recording a trace incrementally.
+
+        :param max_signals: (optional) Maximum number of signals in the trace (default to 100).
+        :param max_size: (optional) Maximum size of the encoded signals (default to 256kB).
+        :param lane: (optional) Name of the lane sending the trace.
+        """
+        lane = properties.pop("lane", None)
+        return self.trace_builder_class(
+            self, properties, max_signals=max_signals, max_size=max_size, lane=lane)
+
+    def encode_signal(self, signal):  # type: (AnySignal) -> str
+        """Return a signal encoded in JSON, with the payload limits applied."""
+        if self.payload_limits:
+            signal = self._cap_signal(signal)
+        return serialize_json(signal, self.sender.json_encoder)
+
+    def encoded_trace(self, signals, **properties):  # type: (Iterable[str], **Any) -> None
+        """Record a trace whose signals are already encoded in JSON.
+
+        :param signals: Signals of the trace, as returned by encode_signal.
+        :param lane: (optional) Name of the lane sending the trace.
+        """
+        lane = properties.pop("lane", None)
+        properties.pop("data", None)
+        if self.clock is not None and "time" not in properties:
+            properties["time"] = self.clock.utcnow()
+        if self.payload_limits and "payload" in properties:
+            properties["payload"] = self._cap_payload(properties["payload"])
+        data = '"data":[{}]'.format(",".join(signals))
+        if properties:
+            encoded = serialize_json(properties, self.sender.json_encoder)
+            encoded = "{},{}}}".format(encoded[:-1], data)
+        else:
+            encoded = "{{{}}}".format(data)
+        return self._add_and_send(RawJSON(encoded), lane=lane)  # type: ignore
+
+    def extend(self, signals, lane=None):  # type: (Iterable[AnySignal], Optional[str]) -> None
+        """Record signals and traces already built, in bulk.
+
+        :param lane: (optional) Name of the lane sending the signals.
+        """
+        if self.payload_limits:
+            signals = [self._cap_signal(signal) for signal in signals]
+        self.lanes[lane or self.default_lane].extend(signals)
+
+    def _cap_signal(self, signal):  # type: (AnySignal) -> AnySignal
+        if isinstance(signal, RawJSON):
+            return signal
+        if "data" in signal:
+            trace = dict(signal)  # type: Any
+            self._cap_trace(trace)
+            return trace
+        if "payload" in signal:
+            signal = dict(signal, payload=self._cap_payload(signal["payload"]))  # type: ignore
+        return signal
+
+    def _add_and_send(self, data, lane=None):  # type: (AnySignal, Optional[str]) -> None
+        self.lanes[lane or self.default_lane].add(data)
 
     def flush(self, soft=False, sync=False):  # type: (bool, bool) -> None
         """Send all pending signals and traces.
@@ -87,18 +311,61 @@ class SyncClient(object):
         the interval time.
         :param sync: (optional) Wait for the batch to be transmitted.
         """
-        batch = self.accumulator.flush(soft=soft)
-        if batch:
-            if sync:
-                self.sender.send_batch(batch)
-            else:
-                self.executor.submit(self.sender.send_batch, batch)
+        for lane in self.lanes.values():
+            lane.flush(soft=soft, sync=sync)
 
-    def close(self):  # type: () -> None
-        """Close the client.
+    def close(self, timeout=None):  # type: (Optional[float]) -> None
+        """Send all pending signals and traces, then close the client.
+
+        :param timeout: (optional) Maximum time in seconds to wait for the
+        pending signals to be sent. The signals not sent in time are written
+        to the spill file if any, or reported as lost. The requests are
+        bounded by the timeout and stop being retried when it expires, those
+        still in progress are written to the spill file if they fail.
         """
-        self.executor.shutdown(wait=True)
-        self.sender.close()
+        self.closed = True
+        deadline = None if timeout is None else monotonic_ms() + int(timeout * 1000)
+        senders = [self.sender] + [
+            lane.sender for lane in self.lanes.values() if lane.sender is not self.sender]
+        for sender in senders:
+            sender.deadline.set(deadline)
+        # Send the batches of all the lanes in parallel before waiting for them.
+        pending = [(lane, lane.drain()) for lane in self.lanes.values()]
+        undelivered = []  # type: List[Batch]
+        for lane, lane_pending in pending:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - monotonic_ms()) / 1000.0
+            undelivered.extend(lane.close(
+                timeout=remaining, pending=lane_pending, on_late_failure=self._spill_batch))
+        if undelivered:
+            self._spill(undelivered)
+        for sender in senders:
+            sender.close()
+        if self.encoding_executor is not None:
+            self.encoding_executor.shutdown(wait=True)
+        if self.clock is not None:
+            self.clock.stop()
+
+    def _spill_batch(self, batch):  # type: (Batch) -> None
+        self._spill([batch])
+
+    def _spill(self, batches):  # type: (List[Batch]) -> None
+        signals = [signal for batch in batches for signal in batch]
+        if self.spill_path is not None:
+            try:
+                with self.spill_lock, open(self.spill_path, "ab") as spill_file:
+                    for signal in signals:
+                        line = self.sender.serialize_data(signal) + "\n"
+                        spill_file.write(line.encode("utf-8"))
+            except Exception:
+                LOGGER.exception("Failed to write the pending signals to %s",
+                                 self.spill_path)
+            else:
+                LOGGER.warning("%d signal(s) could not be sent, written to %s",
+                               len(signals), self.spill_path)
+                return
+        LOGGER.warning("%d signal(s) could not be sent and were lost", len(signals))
 
 
 Client = SyncClient
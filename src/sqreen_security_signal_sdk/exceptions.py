@@ -15,5 +15,27 @@ class DataIngestionFailed(Exception):
     """The recorded data was rejected by the Sqreen Ingestion service."""
 
 
+class PayloadTooLarge(DataIngestionFailed):
+    """The recorded data was too large for the Sqreen Ingestion service."""
+
+
+class BatchPartiallySent(Exception):
+    """Part of a batch could not be sent to the Sqreen Ingestion service.
+
+    The signals which were neither sent nor rejected are kept in ``batch``,
+    with the first ``error`` which prevented them from being sent.
+    """
+
+    def __init__(self, batch, error):
+        super(BatchPartiallySent, self).__init__(
+            "{} signal(s) not sent: {!r}".format(len(batch), error))
+        self.batch = batch
+        self.error = error
+
+
+class DeadlineExceeded(Exception):
+    """The data could not be sent before the sender deadline."""
+
+
 class UnexpectedStatusCode(Exception):
     """Unexpected error from the Sqreen Ingestion service."""
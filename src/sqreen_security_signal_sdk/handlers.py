@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+import collections
+import datetime
+import logging
+import sys
+import threading
+
+from .compat_model import SignalType
+from .utils import UTC
+
+if sys.version_info >= (3, 5):
+    from typing import Deque, List, Optional
+
+    from .client import SyncClient
+    from .compat_model import Signal
+
+
+_FORMATTER = logging.Formatter()
+
+
+class SignalHandler(logging.Handler):
+    """Logging handler recording log records as point signals.
+
+    Logging a record only converts it to a signal and appends it to a queue,
+    without any lock. A listener thread adds the queued signals to the client
+    in bulk, so that logging never waits for the client.
+
+    :param client: Client sending the signals.
+    :param signal_name: Name of the signals.
+    :param level: (optional) Minimum level of the records (default to NOTSET).
+    :param max_queue_size: (optional) Maximum number of queued signals, the
+    records logged while the queue is full are dropped (default to 10000).
+    :param interval: (optional) Interval in seconds at which the listener
+    checks the queue (default to 0.1s).
+    :param lane: (optional) Name of the client lane sending the signals.
+
+    The signals dropped because the queue is full or the client cannot
+    record them, such as once it is closed, are counted in ``dropped``. The
+    records of the SDK loggers are ignored, so that the warnings of the
+    client never come back to it as signals.
+    """
+
+    ignored_logger = __name__.rpartition(".")[0]
+
+    def __init__(self, client, signal_name, level=logging.NOTSET,
+                 max_queue_size=10000, interval=0.1, lane=None):
+        # type: (SyncClient, str, int, int, float, Optional[str]) -> None
+        super(SignalHandler, self).__init__(level=level)
+        self.client = client
+        self.signal_name = signal_name
+        self.max_queue_size = max_queue_size
+        self.interval = interval
+        self.lane = lane
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        # deque appends and pops are atomic, the queue needs no lock.
+        self.queue = collections.deque()  # type: Deque[Signal]
+        self._stopped = threading.Event()
+        self._listener = threading.Thread(
+            target=self._listen, name="sqreen-security-signal-logging")
+        self._listener.daemon = True
+        self._listener.start()
+
+    def handle(self, record):  # type: (logging.LogRecord) -> bool
+        # Emitting a record is thread-safe, do not serialize the logging calls
+        # with the handler lock.
+        if record.name == self.ignored_logger \
+                or record.name.startswith(self.ignored_logger + "."):
+            return False
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return bool(rv)
+
+    def record_to_signal(self, record):  # type: (logging.LogRecord) -> Signal
+        """Convert a log record to a signal."""
+        payload = {
+            "message": record.getMessage(),
+            "level": record.levelname,
+            "logger": record.name,
+            "pathname": record.pathname,
+            "lineno": record.lineno,
+        }
+        if record.exc_info:
+            payload["exception"] = _FORMATTER.formatException(record.exc_info)
+        signal = dict(
+            signal_name=self.signal_name,
+            payload=payload,
+            type=SignalType.POINT,
+            time=datetime.datetime.fromtimestamp(record.created, UTC),
+        )  # type: Signal
+        context = getattr(record, "signal_context", None)
+        if context is not None:
+            signal["context"] = context
+        return signal
+
+    def emit(self, record):  # type: (logging.LogRecord) -> None
+        if len(self.queue) >= self.max_queue_size:
+            self._drop(1)
+            return
+        try:
+            self.queue.append(self.record_to_signal(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):  # type: () -> None
+        """Add the queued signals to the client."""
+        signals = []  # type: List[Signal]
+        try:
+            while True:
+                signals.append(self.queue.popleft())
+        except IndexError:
+            pass
+        if not signals:
+            return
+        if self.client.closed:
+            self._drop(len(signals))
+            return
+        try:
+            self.client.extend(signals, lane=self.lane)
+        except Exception:
+            # The handler cannot log the failure, the signals are counted.
+            self._drop(len(signals))
+
+    def _drop(self, count):  # type: (int) -> None
+        with self.dropped_lock:
+            self.dropped += count
+
+    def _listen(self):  # type: () -> None
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def close(self):  # type: () -> None
+        """Stop the listener and add the remaining signals to the client."""
+        self._stopped.set()
+        self._listener.join()
+        self.flush()
+        super(SignalHandler, self).close()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+"""Local stand-in for the Sqreen Ingestion service.
+
+The server accepts the ``/batches``, ``/signals`` and ``/traces`` requests of
+the SDK, with a configurable latency, error rates and throughput cap, to tune
+the sender settings without a real ingestion endpoint. The delivery latency
+of the signals whose payload has a ``sent_at`` timestamp is recorded, and the
+statistics are returned by ``GET /stats`` and reset by ``DELETE /stats``.
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+
+from .utils import monotonic_ms
+
+if sys.version_info[0] >= 3:
+    from http import server
+    import socketserver
+else:
+    import BaseHTTPServer as server
+    import SocketServer as socketserver
+
+if sys.version_info >= (3, 5):
+    from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def percentile(values, q):  # type: (Sequence[float], float) -> Optional[float]
+    """Return the `q`-th percentile of sorted values, with the nearest rank method."""
+    if not values:
+        return None
+    rank = int(math.ceil(q / 100.0 * len(values))) - 1
+    return values[max(0, min(len(values) - 1, rank))]
+
+
+def sent_times(item):  # type: (Any) -> Iterator[float]
+    """Yield the ``sent_at`` timestamps of a signal or of the signals of a trace."""
+    if not isinstance(item, dict):
+        return
+    payload = item.get("payload")
+    if isinstance(payload, dict) and isinstance(payload.get("sent_at"), (int, float)):
+        yield payload["sent_at"]
+    for child in item.get("data") or ():
+        for sent_at in sent_times(child):
+            yield sent_at
+
+
+class IngestionRequestHandler(server.BaseHTTPRequestHandler):
+
+    # Keep the connections alive like the Ingestion service.
+    protocol_version = "HTTP/1.1"
+    endpoints = ("/batches", "/signals", "/traces")
+
+    def do_POST(self):  # type: () -> None
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path not in self.endpoints:
+            self.respond(404)
+            return
+        self.respond(self.server.process(self.path, body))  # type: ignore
+
+    def do_GET(self):  # type: () -> None
+        if self.path != "/stats":
+            self.respond(404)
+            return
+        self.respond(200, self.server.stats())  # type: ignore
+
+    def do_DELETE(self):  # type: () -> None
+        if self.path != "/stats":
+            self.respond(404)
+            return
+        self.server.reset()  # type: ignore
+        self.respond(200)
+
+    def respond(self, status, data={}):  # type: (int, Mapping[str, Any]) -> None
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # type: (str, *Any) -> None
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+
+class IngestionServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    """Threaded HTTP server standing in for the Sqreen Ingestion service.
+
+    :param address: (optional) Host and port to listen on (default to a free local port).
+    :param latency: (optional) Time in seconds taken to answer each request.
+    :param error_rates: (optional) Mapping of a status code, such as 500,
+    408, 422 or 401, to the ratio of requests answered with it.
+    :param max_rate: (optional) Maximum number of signals accepted per
+    second, the requests above it are answered later.
+    :param seed: (optional) Seed of the random errors.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("localhost", 0), latency=0, error_rates={},
+                 max_rate=None, seed=None):
+        # type: (Tuple[str, int], float, Mapping[int, float], Optional[float], Optional[int]) -> None
+        server.HTTPServer.__init__(self, address, IngestionRequestHandler)
+        self.latency = latency
+        self.error_rates = sorted(error_rates.items())
+        self.max_rate = max_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.reset()
+
+    @property
+    def url(self):  # type: () -> str
+        host, port = self.server_address[:2]
+        return "http://{}:{}/".format(host, port)  # type: ignore
+
+    def reset(self):  # type: () -> None
+        """Reset the statistics."""
+        with self.lock:
+            self.requests = 0
+            self.signals = 0
+            self.errors = {}  # type: Dict[int, int]
+            self.latencies = []  # type: List[float]
+
+    def process(self, endpoint, body):  # type: (str, bytes) -> int
+        """Process a request and return its response status."""
+        if self.latency:
+            time.sleep(self.latency)
+        status = self.pick_error()
+        if status is None:
+            try:
+                data = json.loads(body.decode("utf-8"))
+            except ValueError:
+                status = 400
+            else:
+                items = data if endpoint == "/batches" else [data]
+                if not isinstance(items, list):
+                    status = 422
+        if status is not None:
+            with self.lock:
+                self.requests += 1
+                self.errors[status] = self.errors.get(status, 0) + 1
+            return status
+
+        self.throttle(len(items))
+        delivered_at = time.time()
+        with self.lock:
+            self.requests += 1
+            self.signals += len(items)
+            for item in items:
+                self.latencies.extend(delivered_at - sent_at for sent_at in sent_times(item))
+        return 202
+
+    def pick_error(self):  # type: () -> Optional[int]
+        with self.lock:
+            draw = self.random.random()
+        for status, rate in self.error_rates:
+            if draw < rate:
+                return status
+            draw -= rate
+        return None
+
+    def throttle(self, count):  # type: (int) -> None
+        # Each request reserves the time its signals take at the maximum rate.
+        if not self.max_rate:
+            return
+        with self.lock:
+            now = monotonic_ms() / 1000.0
+            self.next_slot = max(now, self.next_slot) + count / float(self.max_rate)
+            delay = self.next_slot - now
+        time.sleep(delay)
+
+    def stats(self):  # type: () -> Dict[str, Any]
+        """Return the statistics recorded since the last reset."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(
+                requests=self.requests,
+                signals=self.signals,
+                errors={str(status): count for status, count in self.errors.items()},
+            )  # type: Dict[str, Any]
+        stats["latency_ms"] = {
+            name: None if value is None else value * 1000
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p90", percentile(latencies, 90)),
+                ("p99", percentile(latencies, 99)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        }
+        return stats
+
+
+def parse_error_rate(value):  # type: (str) -> Tuple[int, float]
+    try:
+        status, rate = value.split("=", 1)
+        return int(status), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected STATUS=RATE, got {!r}".format(value))
+
+
+def main(argv=None):  # type: (Optional[List[str]]) -> int
+    parser = argparse.ArgumentParser(
+        prog="sqreen-signal-ingestion-server",
+        description="Run a local stand-in for the Sqreen Ingestion service.")
+    parser.add_argument("--host", default="localhost", help="listening host (default: localhost)")
+    parser.add_argument("--port", type=int, default=8080, help="listening port (default: 8080)")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="time in seconds taken to answer each request (default: 0)")
+    parser.add_argument("--error-rate", type=parse_error_rate, action="append", default=[],
+                        metavar="STATUS=RATE",
+                        help="answer this ratio of the requests with this status, e.g. 500=0.01")
+    parser.add_argument("--max-rate", type=float,
+                        help="maximum number of signals accepted per second")
+    parser.add_argument("--seed", type=int, help="seed of the random errors")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    ingestion_server = IngestionServer(
+        (args.host, args.port), latency=args.latency, error_rates=dict(args.error_rate),
+        max_rate=args.max_rate, seed=args.seed)
+    LOGGER.info("Listening on %s", ingestion_server.url)
+    try:
+        ingestion_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingestion_server.server_close()
+        LOGGER.info("%s", json.dumps(ingestion_server.stats(), sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
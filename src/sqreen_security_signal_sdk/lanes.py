@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+import functools
+import sys
+import threading
+from concurrent import futures
+
+from .exceptions import BatchPartiallySent
+from .utils import monotonic_ms
+
+if sys.version_info >= (3, 5):
+    from typing import Any, Callable, Dict, Iterable, List, Optional
+
+    from .accumulator import BatchingAccumulator
+    from .adaptive import AdaptiveBatchController
+    from .compat_model import AnySignal, Batch
+    from .sender import BaseSender
+
+
+class Lane(object):
+    """Batching lane with its own accumulator and worker threads.
+
+    Batches of a lane are never queued behind the batches of another lane.
+
+    :param sender: Sender used to transmit the batches.
+    :param accumulator: Accumulator collecting the signals of the lane.
+    :param max_workers: (optional) Number of threads sending the batches of the lane (default to 1).
+    :param executor: (optional) Executor sending the batches instead of the threads of the lane.
+    :param controller: (optional) Controller tuning the accumulator from the sent batches.
+    """
+
+    def __init__(self, sender, accumulator, max_workers=1, executor=None, controller=None):
+        # type: (BaseSender, BatchingAccumulator, int, Optional[Any], Optional[AdaptiveBatchController]) -> None
+        self.sender = sender
+        self.accumulator = accumulator
+        self.controller = controller
+        self.max_workers = max_workers
+        if executor is None:
+            executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.executor = executor
+        self.pending = {}  # type: Dict[futures.Future, Batch]
+        self.pending_lock = threading.Lock()
+
+    def add(self, data):  # type: (AnySignal) -> None
+        """Add a signal to the lane and send the batch if needed."""
+        batch = self.accumulator.add(data)
+        if batch:
+            self.submit(batch)
+
+    def extend(self, signals):  # type: (Iterable[AnySignal]) -> None
+        """Add signals to the lane and send the batches if needed."""
+        for batch in self.accumulator.extend(signals):
+            self.submit(batch)
+
+    def submit(self, batch):  # type: (Batch) -> futures.Future
+        """Send a batch in the background."""
+        future = self.executor.submit(self._send_batch, batch)
+        with self.pending_lock:
+            self.pending[future] = batch
+        future.add_done_callback(self._remove_pending)
+        return future
+
+    def _send_batch(self, batch):  # type: (Batch) -> None
+        if self.controller is None:
+            return self.sender.send_batch(batch)
+        start = monotonic_ms()
+        try:
+            return self.sender.send_batch(batch)
+        finally:
+            latency = (monotonic_ms() - start) / 1000.0
+            with self.pending_lock:
+                # Only count the batches waiting for a worker, not the ones
+                # being sent such as this one.
+                queue_depth = sum(
+                    1 for future in self.pending
+                    if not future.running() and not future.done())
+            self.controller.observe(len(batch), latency, queue_depth)
+
+    def _remove_pending(self, future):  # type: (futures.Future) -> None
+        with self.pending_lock:
+            self.pending.pop(future, None)
+
+    def flush(self, soft=False, sync=False):  # type: (bool, bool) -> Optional[Batch]
+        """Send the pending signals of the lane.
+
+        :param soft: (optional) Do not send the batch if it has not exceeded
+        the linger time.
+        :param sync: (optional) Wait for the batch to be transmitted.
+        """
+        batch = self.accumulator.flush(soft=soft)
+        if batch:
+            if sync:
+                self._send_batch(batch)
+            else:
+                self.submit(batch)
+        return batch
+
+    def drain(self):  # type: () -> Dict[futures.Future, Batch]
+        """Send the pending signals and return the batches being sent."""
+        with self.pending_lock:
+            pending = dict(self.pending)
+        batch = self.accumulator.flush()
+        if batch:
+            pending[self.submit(batch)] = batch
+        return pending
+
+    def close(self, timeout=None, pending=None, on_late_failure=None):
+        # type: (Optional[float], Optional[Dict[futures.Future, Batch]], Optional[Callable[[Batch], None]]) -> List[Batch]
+        """Send the pending signals and wait for the batches of the lane to be sent.
+
+        :param timeout: (optional) Maximum time to wait in seconds.
+        :param pending: (optional) Batches being sent, as returned by drain.
+        :param on_late_failure: (optional) Called with the batches still being
+        sent when the timeout expires, once they failed.
+
+        Return the batches which failed or were not sent before the timeout,
+        with only their signals not sent when they were partially sent. The
+        batches still being sent when the timeout expires are not returned,
+        so that they are never reported while they may be received.
+        """
+        if pending is None:
+            pending = self.drain()
+        done, not_done = futures.wait(pending, timeout=timeout)
+        undelivered = []
+        for future, batch in pending.items():
+            if future in not_done and not future.cancel():
+                if on_late_failure is not None:
+                    future.add_done_callback(
+                        functools.partial(self._report_late_failure, on_late_failure, batch))
+            elif future.cancelled():
+                undelivered.append(batch)
+            elif future.exception() is not None:
+                undelivered.append(self._undelivered_part(batch, future.exception()))
+        self.executor.shutdown(wait=timeout is None)
+        return undelivered
+
+    @staticmethod
+    def _report_late_failure(on_late_failure, batch, future):
+        # type: (Callable[[Batch], None], Batch, futures.Future) -> None
+        if future.exception() is not None:
+            on_late_failure(Lane._undelivered_part(batch, future.exception()))
+
+    @staticmethod
+    def _undelivered_part(batch, exc):  # type: (Batch, Optional[BaseException]) -> Batch
+        # Only the signals of a partially sent batch which were not sent.
+        if isinstance(exc, BatchPartiallySent):
+            return exc.batch
+        return batch
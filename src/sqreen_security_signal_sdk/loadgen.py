@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+"""Generate signals with SyncClient to measure the delivery of the SDK.
+
+The signals are recorded from several threads sharing a client, or from
+several processes with a client each, and carry their recording time in
+``payload.sent_at``. Against the stand-in ingestion server, the delivery
+latency percentiles measured by the server are reported along with the
+throughput.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from urllib3 import PoolManager  # type: ignore
+from urllib3.util import Timeout
+
+from .client import SyncClient
+from .sender import SyncSender
+from .utils import monotonic_ms
+
+if sys.version_info[0] >= 3:
+    from urllib import parse as urlparse
+else:
+    import urlparse
+
+if sys.version_info >= (3, 5):
+    from typing import Any, Dict, List, Mapping, Optional
+
+
+LOGGER = logging.getLogger(__name__)
+
+SIGNAL_NAME = "sq.sdk.load_test"
+
+
+def create_client(options):  # type: (Mapping[str, Any]) -> SyncClient
+    """Create a client with the sender settings of the options."""
+    timeout = options["timeout"]
+    sender_class = type("LoadSender", (SyncSender,), dict(
+        retry_policy=SyncSender.retry_policy.new(total=options["retries"]),
+        timeout_policy=Timeout(connect=timeout, read=timeout),
+    ))
+    client_class = type("LoadClient", (SyncClient,), dict(
+        sender_class=sender_class,
+        max_workers=options["pool_size"],
+    ))
+    return client_class(
+        token=options["token"], base_url=options["base_url"],
+        max_batch_size=options["batch_size"], interval_batch=options["interval"])
+
+
+def generate(client, count, rate=None, payload_size=0):
+    # type: (SyncClient, int, Optional[float], int) -> int
+    """Record `count` signals, at most `rate` per second."""
+    padding = "x" * payload_size
+    start = monotonic_ms()
+    for i in range(count):
+        if rate:
+            delay = start + i * 1000.0 / rate - monotonic_ms()
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+        client.point(signal_name=SIGNAL_NAME, payload={"sent_at": time.time(), "padding": padding})
+    return count
+
+
+def run_process(options):  # type: (Mapping[str, Any]) -> int
+    client = create_client(options)
+    try:
+        return generate(client, options["signals"], options["rate"], options["payload_size"])
+    finally:
+        client.close()
+
+
+def run_threads(options):  # type: (Mapping[str, Any]) -> int
+    client = create_client(options)
+    try:
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = [
+                executor.submit(generate, client, options["signals"],
+                                options["rate"], options["payload_size"])
+                for _ in range(options["workers"])
+            ]
+            return sum(result.result() for result in results)
+    finally:
+        client.close()
+
+
+def server_stats(base_url, method="GET"):  # type: (str, str) -> Optional[Dict[str, Any]]
+    """Request the statistics of the stand-in server, None if unavailable."""
+    pool_manager = PoolManager()
+    try:
+        response = pool_manager.request(
+            method, urlparse.urljoin(base_url, "/stats"), retries=False)
+        if response.status != 200:
+            return None
+        return json.loads(response.data.decode("utf-8"))
+    except Exception:
+        return None
+    finally:
+        pool_manager.clear()
+
+
+def main(argv=None):  # type: (Optional[List[str]]) -> int
+    parser = argparse.ArgumentParser(
+        prog="sqreen-signal-loadgen",
+        description="Generate signals to measure the delivery of the SDK.")
+    parser.add_argument("--base-url", default="http://localhost:8080/",
+                        help="ingestion API URL (default: http://localhost:8080/)")
+    parser.add_argument("--token", default="load-test", help="application API token")
+    parser.add_argument("--signals", type=int, default=10000,
+                        help="number of signals recorded per worker (default: 10000)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of threads or processes recording signals (default: 4)")
+    parser.add_argument("--processes", action="store_true",
+                        help="record from processes with a client each instead of threads")
+    parser.add_argument("--rate", type=float,
+                        help="maximum number of signals recorded per second and worker")
+    parser.add_argument("--payload-size", type=int, default=100,
+                        help="size of the padding of the payloads (default: 100)")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="maximum number of signals per batch (default: 50)")
+    parser.add_argument("--interval", type=float, default=1,
+                        help="interval in seconds at which non-empty batches are sent (default: 1)")
+    parser.add_argument("--pool-size", type=int, default=SyncClient.max_workers,
+                        help="number of batches sent in parallel per client (default: {})".format(
+                            SyncClient.max_workers))
+    parser.add_argument("--retries", type=int, default=SyncSender.retry_policy.total,
+                        help="number of retries of a request (default: {})".format(
+                            SyncSender.retry_policy.total))
+    parser.add_argument("--timeout", type=float, default=10,
+                        help="connect and read timeout in seconds (default: 10)")
+    args = parser.parse_args(argv)
+    options = vars(args)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    has_stats = server_stats(args.base_url, method="DELETE") is not None
+    start = monotonic_ms()
+    if args.processes:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            recorded = sum(executor.map(run_process, [options] * args.workers))
+    else:
+        recorded = run_threads(options)
+    elapsed = max(monotonic_ms() - start, 1) / 1000.0
+    LOGGER.info("%d signals recorded and flushed in %.1fs (%.0f signals/s)",
+                recorded, elapsed, recorded / elapsed)
+
+    stats = server_stats(args.base_url) if has_stats else None
+    if stats is None:
+        LOGGER.info("No statistics from the server, is it the stand-in ingestion server?")
+        return 0
+    latency = stats["latency_ms"]
+    LOGGER.info("%d signals delivered in %d requests (%.0f signals/s), errors: %s",
+                stats["signals"], stats["requests"], stats["signals"] / elapsed,
+                json.dumps(stats["errors"], sort_keys=True))
+    if latency["max"] is not None:
+        LOGGER.info("Delivery latency: p50 %.1fms, p90 %.1fms, p99 %.1fms, max %.1fms",
+                    latency["p50"], latency["p90"], latency["p99"], latency["max"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,17 +4,24 @@
 #
 #     https://www.sqreen.io/terms.html
 #
+import collections
 import json
 import logging
+import pickle
+import socket
 import sys
+import threading
+from concurrent import futures
 
-from urllib3 import Retry, poolmanager, util  # type: ignore
+from urllib3 import Retry, connection, exceptions, poolmanager, util  # type: ignore
 from urllib3.util import Timeout
 
 from .compat_model import Batch, Signal, Trace
-from .exceptions import (AuthenticationFailed, DataIngestionFailed,
-                         UnexpectedStatusCode)
-from .utils import CustomJSONEncoder, reencode_payload
+from .exceptions import (AuthenticationFailed, BatchPartiallySent,
+                         DataIngestionFailed, DeadlineExceeded,
+                         PayloadTooLarge, UnexpectedStatusCode)
+from .utils import (CustomJSONEncoder, Deadline, RawJSON, monotonic_ms,
+                    reencode_payload)
 
 if sys.version_info[0] >= 3:
     from urllib import parse as urlparse
@@ -22,7 +29,8 @@ else:
     import urlparse
 
 if sys.version_info >= (3, 5):
-    from typing import Any, Mapping, Optional, Union, Type
+    from typing import (Any, Callable, Deque, Dict, List, Mapping, Optional,
+                        Tuple, Type, Union)
 
     from .compat_model import AnySignal
 
@@ -30,6 +38,49 @@ if sys.version_info >= (3, 5):
 LOGGER = logging.getLogger(__name__)
 
 
+def serialize_json(data, json_encoder=CustomJSONEncoder):
+    # type: (Any, Type[json.JSONEncoder]) -> str
+    """Serialize data to compact JSON, reencoding it if needed."""
+    if isinstance(data, RawJSON):
+        return data.json
+    if isinstance(data, list) and any(isinstance(item, RawJSON) for item in data):
+        return "[{}]".format(",".join(serialize_json(item, json_encoder) for item in data))
+    try:
+        return json.dumps(data, separators=(",", ":"), cls=json_encoder)
+    except UnicodeDecodeError:
+        reencoded_data = reencode_payload(data)
+        return json.dumps(reencoded_data, separators=(",", ":"), cls=json_encoder)
+
+
+def serialize_pickled_json(pickled):  # type: (bytes) -> str
+    """Serialize data pickled with its JSON encoder, in an encoding process."""
+    data, json_encoder = pickle.loads(pickled)
+    return serialize_json(data, json_encoder)
+
+
+class DeadlineRetry(Retry):
+    """Retry policy giving up once the deadline of the request has passed."""
+
+    deadline = None  # type: Optional[Deadline]
+
+    def new(self, **kw):  # type: (**Any) -> DeadlineRetry
+        retry = super(DeadlineRetry, self).new(**kw)
+        retry.deadline = self.deadline
+        return retry
+
+    def with_deadline(self, deadline):  # type: (Deadline) -> DeadlineRetry
+        """Return a copy of the policy bound to a deadline."""
+        retry = self.new()
+        retry.deadline = deadline
+        return retry
+
+    def increment(self, *args, **kwargs):  # type: (*Any, **Any) -> Retry
+        if self.deadline is not None and self.deadline.expired():
+            # Exhaust the retries to raise the usual error.
+            return Retry.increment(self.new(total=0), *args, **kwargs)
+        return super(DeadlineRetry, self).increment(*args, **kwargs)
+
+
 class BaseSender(object):
     """Base sender for the Sqreen Ingestion service.
 
@@ -37,21 +88,100 @@ class BaseSender(object):
     :param proxy_url: (optional) URL of a Proxy server.
     :param headers: (optional) Headers to send with all requests.
     :param json_encoder: (optional) JSON serializer for data to be sent.
+    :param max_pool_size: (optional) Maximum number of concurrent connections.
+    :param encoding_executor: (optional) Executor serializing the data, such as
+    a process pool taking the JSON encoding off the application threads.
+
+    When a batch is rejected, it is split in halves which are sent again
+    until the rejected signals are isolated. These are kept in the
+    ``quarantine`` (up to ``max_quarantine_size`` signals) instead of being
+    sent again, and passed to ``on_quarantine`` when it is set. Splitting
+    stops after ``max_split_depth`` levels, or when both halves are rejected,
+    the remaining signals being quarantined together. When some halves fail
+    for another reason, BatchPartiallySent is raised with their signals.
+
+    Once its ``deadline`` is set, the requests of the sender are bounded by
+    the remaining time and stop being retried when it expires.
     """
 
     default_base_url = "https://ingestion.sqreen.com/"  # type: str
     default_json_encoder = CustomJSONEncoder
+    max_pool_size = 1
+    split_rejected_batches = True
+    max_quarantine_size = 100
+    max_split_depth = 8
+    # Maximum time in seconds to wait for the encoding executor before
+    # serializing the data in the calling thread.
+    encoding_timeout = 30
 
-    def __init__(self, base_url=None, proxy_url=None, headers={}, json_encoder=None):
-        # type: (Optional[str], Optional[str], Mapping[str, str], Optional[Type[json.JSONEncoder]]) -> None
+    def __init__(self, base_url=None, proxy_url=None, headers={}, json_encoder=None,
+                 max_pool_size=None, encoding_executor=None):
+        # type: (Optional[str], Optional[str], Mapping[str, str], Optional[Type[json.JSONEncoder]], Optional[int], Optional[futures.Executor]) -> None
         self.base_url = base_url or self.default_base_url
         self.proxy_url = proxy_url
         self.headers = headers
         self.json_encoder = json_encoder or self.default_json_encoder
+        if max_pool_size is not None:
+            self.max_pool_size = max_pool_size
+        self.encoding_executor = encoding_executor
+        self.quarantine = collections.deque(maxlen=self.max_quarantine_size)  # type: Deque[AnySignal]
+        self.on_quarantine = None  # type: Optional[Callable[[Batch], None]]
+        self.deadline = Deadline()
 
     def send_batch(self, data, headers={}, **kwargs):
         # type: (Batch, Mapping[str, str], **Any) -> None
-        return self.send("/batches", data, headers=headers, **kwargs)
+        try:
+            return self.send("/batches", data, headers=headers, **kwargs)
+        except DataIngestionFailed as exc:
+            if not self.split_rejected_batches:
+                raise
+            self._split_batch(data, exc, 0, headers, kwargs)
+
+    def _split_batch(self, data, exc, depth, headers, kwargs):
+        # type: (Batch, DataIngestionFailed, int, Mapping[str, str], Dict[str, Any]) -> None
+        if len(data) <= 1 or depth >= self.max_split_depth:
+            self.quarantine_data(data, exc)
+            return
+        middle = len(data) // 2
+        halves = [Batch(data[:middle]), Batch(data[middle:])]
+        rejected = []  # type: List[Tuple[Batch, DataIngestionFailed]]
+        undelivered = []  # type: List[AnySignal]
+        error = None  # type: Optional[Exception]
+        # Both halves are always sent, a failure only loses its own half.
+        for half in halves:
+            try:
+                self.send("/batches", half, headers=headers, **kwargs)
+            except DataIngestionFailed as rejection:
+                rejected.append((half, rejection))
+            except Exception as failure:
+                undelivered.extend(half)
+                error = error or failure
+        if len(rejected) == 2 and not any(
+                isinstance(half_exc, PayloadTooLarge) for _, half_exc in rejected):
+            # The halves of a batch too large are still too large, but when
+            # both halves are rejected, so are most likely all the signals.
+            self.quarantine_data(data, exc)
+            rejected = []
+        for half, half_exc in rejected:
+            try:
+                self._split_batch(half, half_exc, depth + 1, headers, kwargs)
+            except BatchPartiallySent as split_exc:
+                undelivered.extend(split_exc.batch)
+                error = error or split_exc.error
+            except Exception as split_exc:
+                undelivered.extend(half)
+                error = error or split_exc
+        if undelivered:
+            raise BatchPartiallySent(Batch(undelivered), error)
+
+    def quarantine_data(self, data, exc):
+        # type: (Batch, DataIngestionFailed) -> None
+        """Keep aside signals rejected by the Ingestion service."""
+        LOGGER.warning("%d signal(s) rejected by the ingestion service: %r",
+                       len(data), exc)
+        self.quarantine.extend(data)
+        if self.on_quarantine is not None:
+            self.on_quarantine(data)
 
     def send_signal(self, data, headers={}, **kwargs):
         # type: (Signal, Mapping[str, str], **Any) -> None
@@ -67,23 +197,40 @@ class BaseSender(object):
 
     def serialize_data(self, data):
         # type: (Union[AnySignal, Batch]) -> str
-        try:
-            return json.dumps(
-                data, separators=(",", ":"), cls=self.json_encoder)
-        except UnicodeDecodeError:
-            reencoded_data = reencode_payload(data)
-            return json.dumps(
-                reencoded_data, separators=(",", ":"), cls=self.json_encoder)
+        if self.encoding_executor is not None:
+            # Pickle in this thread: before Python 3.7, a pickling error in
+            # the process pool feeder thread leaves the future pending forever.
+            try:
+                pickled = pickle.dumps((data, self.json_encoder), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                LOGGER.debug("Data cannot be pickled, serializing it in this thread",
+                             exc_info=True)
+            else:
+                try:
+                    return self.encoding_executor.submit(
+                        serialize_pickled_json, pickled).result(timeout=self.encoding_timeout)
+                except Exception:
+                    LOGGER.debug("Failed to serialize data in the encoding executor",
+                                 exc_info=True)
+        return serialize_json(data, self.json_encoder)
 
     def handle_response(self, response):
         if response.status not in (200, 202):
             if response.status == 422:
                 raise DataIngestionFailed
+            elif response.status == 413:
+                raise PayloadTooLarge
             elif response.status in (401, 403):
                 raise AuthenticationFailed
             raise UnexpectedStatusCode(response.status)
         # ignore the response content for now
 
+    def warm_up(self):  # type: () -> None
+        """Open the connections ahead of the first requests."""
+
+    def start_keepalive(self, interval):  # type: (float) -> None
+        """Keep the connections ready while the sender is idle."""
+
     def close(self):  # type: () -> None
         raise NotImplementedError
 
@@ -96,60 +243,161 @@ class SyncSender(BaseSender):
     :param proxy_url: (optional) URL of a Proxy server.
     :param headers: (optional) Headers to send with all requests.
     :param json_encoder: (optional) JSON serializer for data to be sent.
+    :param max_pool_size: (optional) Maximum number of concurrent connections.
+    :param encoding_executor: (optional) Executor serializing the data, such as
+    a process pool taking the JSON encoding off the application threads.
+
+    Connections are kept alive between requests. They can be opened before
+    the first request with warm_up, and reopened in the background before
+    the server closes them for being idle with start_keepalive.
     """
 
-    max_pool_size = 1
-    retry_policy = Retry(
+    retry_policy = DeadlineRetry(
         total=3,
         method_whitelist=False,
         status_forcelist={500, 502, 503, 504, 408},
         raise_on_status=True,
     )
     timeout_policy = Timeout(connect=10, read=10)
+    socket_options = connection.HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
 
-    def __init__(self, base_url=None, proxy_url=None, headers={}, json_encoder=None):
-        # type: (Optional[str], Optional[str], Mapping[str, str], Optional[Type[json.JSONEncoder]]) -> None
+    def __init__(self, base_url=None, proxy_url=None, headers={}, json_encoder=None,
+                 max_pool_size=None, encoding_executor=None):
+        # type: (Optional[str], Optional[str], Mapping[str, str], Optional[Type[json.JSONEncoder]], Optional[int], Optional[futures.Executor]) -> None
         base_headers = util.make_headers(keep_alive=True, accept_encoding=True)
         base_headers.update(headers)
         super(SyncSender, self).__init__(
             base_url=base_url, proxy_url=proxy_url, headers=base_headers,
-            json_encoder=json_encoder)
+            json_encoder=json_encoder, max_pool_size=max_pool_size,
+            encoding_executor=encoding_executor)
 
         options = dict(
             block=True,
             maxsize=self.max_pool_size,
+            socket_options=self.socket_options,
         )
         if self.proxy_url is not None:
             self.pool_manager = poolmanager.ProxyManager(self.proxy_url, **options)  # type: poolmanager.PoolManager
         else:
             self.pool_manager = poolmanager.PoolManager(**options)
 
+        self.last_activity = monotonic_ms()
+        # Number of requests in progress, the connections are never reopened
+        # while one is in flight.
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._keepalive_stopped = threading.Event()
+        self._keepalive_thread = None  # type: Optional[threading.Thread]
+
     def _url(self, endpoint):
         return urlparse.urljoin(self.base_url, endpoint, allow_fragments=False)
 
     def send(self, endpoint, data, headers={}, **kwargs):
         # type: (str, Union[AnySignal, Batch], Mapping[str, str], **Any) -> None
         assert self.pool_manager is not None
+        deadline = kwargs.pop("deadline", self.deadline)  # type: Deadline
+        retries = self.retry_policy
+        if isinstance(retries, DeadlineRetry):
+            retries = retries.with_deadline(deadline)
+        timeout = self.timeout_policy
+        remaining = deadline.remaining()
+        if remaining is not None:
+            if not remaining:
+                raise DeadlineExceeded
+            timeout = Timeout(total=remaining, connect=timeout.connect_timeout,
+                              read=timeout.read_timeout)
         body = self.serialize_data(data)
         request_headers = dict(self.headers)
         request_headers["Content-Type"] = "application/json"
         request_headers.update(headers)
         url = self._url(endpoint)
-        response = self.pool_manager.urlopen(
-            "POST",
-            url,
-            body=body,
-            headers=request_headers,
-            preload_content=True,
-            release_conn=True,
-            redirect=False,
-            retries=self.retry_policy,
-            timeout=self.timeout_policy,
-            **kwargs
-        )
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            response = self.pool_manager.urlopen(
+                "POST",
+                url,
+                body=body,
+                headers=request_headers,
+                preload_content=True,
+                release_conn=True,
+                redirect=False,
+                retries=retries,
+                timeout=timeout,
+                **kwargs
+            )
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+                self.last_activity = monotonic_ms()
         return self.handle_response(response)
 
+    def warm_up(self):  # type: () -> None
+        """Open the connections ahead of the first requests.
+
+        Only the idle connections of the pool are opened, warming up never
+        waits for connections in use. urllib3 has no public API to open the
+        connections of a pool, this relies on the ``_get_conn`` and
+        ``_put_conn`` methods of its HTTPConnectionPool (urllib3 1.25 to 2.x)
+        and does nothing when they are not available.
+        """
+        pool = self.pool_manager.connection_from_url(self.base_url)
+        if not (hasattr(pool, "_get_conn") and hasattr(pool, "_put_conn")):
+            LOGGER.debug("Connection warm-up is not supported by this urllib3 version")
+            return
+        conns = []
+        try:
+            for _ in range(self.max_pool_size):
+                conns.append(pool._get_conn(timeout=0))
+        except exceptions.EmptyPoolError:
+            pass
+        for conn in conns:
+            try:
+                if getattr(conn, "sock", None) is None:
+                    conn.connect()
+            except Exception:
+                LOGGER.debug("Failed to warm up a connection", exc_info=True)
+                conn.close()
+            finally:
+                pool._put_conn(conn)
+
+    def start_keepalive(self, interval):  # type: (float) -> None
+        """Reopen the connections after `interval` seconds of inactivity.
+
+        The interval should be shorter than the idle timeout of the server, so
+        that requests never hit a connection closed by the server nor pay for
+        a new connection.
+        """
+        if self._keepalive_thread is None:
+            self._keepalive_stopped.clear()
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive, args=(interval,),
+                name="sqreen-security-signal-keepalive")
+            self._keepalive_thread.daemon = True
+            self._keepalive_thread.start()
+
+    def _keepalive(self, interval):  # type: (float) -> None
+        while not self._keepalive_stopped.wait(interval):
+            with self._in_flight_lock:
+                idle = not self._in_flight \
+                    and monotonic_ms() - self.last_activity >= interval * 1000
+                if idle:
+                    # The requests starting from now use the new connections.
+                    self.pool_manager.clear()
+                    self.last_activity = monotonic_ms()
+            if idle:
+                try:
+                    self.warm_up()
+                except Exception:
+                    LOGGER.debug("Failed to reopen the connections", exc_info=True)
+
     def close(self):  # type: () -> None
+        self._keepalive_stopped.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
         self.pool_manager.clear()
         del self.pool_manager
 
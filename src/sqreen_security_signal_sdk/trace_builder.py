@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+import sys
+import threading
+
+from .compat_model import SignalType
+
+if sys.version_info >= (3, 5):
+    from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+    from .compat_model import Signal
+
+    if TYPE_CHECKING:
+        # The client module imports this one.
+        from .client import SyncClient
+
+
+class TraceBuilder(object):
+    """Build a trace incrementally, encoding its signals as they are added.
+
+    Only the encoded signals are kept, up to `max_signals` signals and
+    `max_size` characters. The signals added past these limits are dropped
+    and summarized by a last signal named ``overflow_signal_name``. The trace
+    is recorded with the encoded_trace method of the client once finished,
+    which the builder does when used as a context manager.
+
+    :param client: Client recording the trace.
+    :param properties: (optional) Properties of the trace.
+    :param max_signals: (optional) Maximum number of signals in the trace (default to 100).
+    :param max_size: (optional) Maximum size of the encoded signals (default to 256kB).
+    :param lane: (optional) Name of the lane sending the trace.
+    """
+
+    overflow_signal_name = "sq.sdk.trace_overflow"
+    # Maximum number of signal names counted in the overflow summary.
+    max_overflow_names = 20
+
+    def __init__(self, client, properties={}, max_signals=100, max_size=256 * 1024, lane=None):
+        # type: (SyncClient, Dict[str, Any], int, int, Optional[str]) -> None
+        self.client = client
+        self.properties = properties
+        self.max_signals = max_signals
+        self.max_size = max_size
+        self.lane = lane
+        self.signals = []  # type: List[str]
+        self.size = 0
+        self.dropped = 0
+        self.dropped_names = {}  # type: Dict[str, int]
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def __enter__(self):  # type: () -> TraceBuilder
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):  # type: (Any, Any, Any) -> None
+        self.finish()
+
+    def point(self, signal_name, payload, **properties):  # type: (str, Any, **Any) -> None
+        """Add a point signal to the trace."""
+        properties["type"] = SignalType.POINT
+        return self.signal(signal_name, payload, **properties)
+
+    def metric(self, signal_name, payload, **properties):  # type: (str, Any, **Any) -> None
+        """Add a metric signal to the trace."""
+        properties["type"] = SignalType.METRIC
+        return self.signal(signal_name, payload, **properties)
+
+    def signal(self, signal_name, payload, **properties):  # type: (str, Any, **Any) -> None
+        """Add a signal to the trace."""
+        signal = dict(signal_name=signal_name, payload=payload)  # type: Signal
+        signal.update(properties)  # type: ignore
+        return self.add(signal)
+
+    def add(self, signal):  # type: (Signal) -> None
+        """Add a signal already built to the trace."""
+        encoded = self.client.encode_signal(signal)
+        with self.lock:
+            if self.finished:
+                raise RuntimeError("cannot add signals to a finished trace")
+            if len(self.signals) >= self.max_signals \
+                    or self.size + len(encoded) > self.max_size:
+                self.dropped += 1
+                name = signal.get("signal_name")
+                if name in self.dropped_names \
+                        or len(self.dropped_names) < self.max_overflow_names:
+                    self.dropped_names[name] = self.dropped_names.get(name, 0) + 1
+                return
+            self.signals.append(encoded)
+            self.size += len(encoded)
+
+    def finish(self):  # type: () -> None
+        """Record the trace with the client."""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            signals = self.signals
+            self.signals = []
+            if self.dropped:
+                signals.append(self.client.encode_signal(dict(
+                    signal_name=self.overflow_signal_name,
+                    payload=dict(dropped=self.dropped, signal_names=self.dropped_names),
+                    type=SignalType.POINT,
+                )))
+        self.client.encoded_trace(signals, lane=self.lane, **self.properties)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+import collections
+import sys
+import threading
+from concurrent import futures
+
+from .sender import BaseSender, SyncSender
+
+if sys.version_info >= (3, 5):
+    from typing import Any, Callable, Deque, Mapping, Optional, Tuple, Union
+
+    from .compat_model import AnySignal, Batch
+
+    Job = Tuple[futures.Future, Callable[..., Any], Tuple[Any, ...], Mapping[str, Any]]
+
+
+class TenantSender(BaseSender):
+    """Sender adding the headers of a client to the requests of a shared sender.
+
+    :param sender: Shared sender.
+    :param headers: (optional) Headers to send with all requests of the client.
+    """
+
+    def __init__(self, sender, headers={}):  # type: (BaseSender, Mapping[str, str]) -> None
+        super(TenantSender, self).__init__(
+            base_url=sender.base_url, proxy_url=sender.proxy_url, headers=headers,
+            json_encoder=sender.json_encoder, max_pool_size=sender.max_pool_size)
+        self.sender = sender
+
+    def send(self, endpoint, data, headers={}, **kwargs):
+        # type: (str, Union[AnySignal, Batch], Mapping[str, str], **Any) -> None
+        request_headers = dict(self.headers)
+        request_headers.update(headers)
+        kwargs.setdefault("deadline", self.deadline)
+        return self.sender.send(endpoint, data, headers=request_headers, **kwargs)
+
+    def warm_up(self):  # type: () -> None
+        self.sender.warm_up()
+
+    def close(self):  # type: () -> None
+        """The shared sender is closed with its transport."""
+
+
+class TenantExecutor(object):
+    """Executor running its jobs on the worker threads of a shared transport.
+
+    :param transport: Shared transport.
+    :param priority: (optional) Run the jobs on the priority worker threads.
+    """
+
+    def __init__(self, transport, priority=False):  # type: (SharedTransport, bool) -> None
+        self.transport = transport
+        self.priority = priority
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        # type: (Callable[..., Any], *Any, **Any) -> futures.Future
+        if self.closed:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        if self.priority:
+            return self.transport.priority_executor.submit(fn, *args, **kwargs)
+        return self.transport.submit(self, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):  # type: (bool) -> None
+        """Refuse new jobs, the submitted ones are still run by the transport."""
+        self.closed = True
+
+
+class SharedTransport(object):
+    """Sender and worker threads shared by the clients of many applications.
+
+    Each client keeps its own accumulators and headers, while the batches of
+    all the clients are sent by the same connections and worker threads. The
+    workers take the batches of the clients in turn, so that a client sending
+    a lot of batches does not delay the batches of the other clients.
+
+    The batches of the priority lanes of all the clients are sent ahead of
+    the others, by their own worker threads and connections.
+
+    :param base_url: (optional) Set a different ingestion API URL.
+    :param proxy_url: (optional) Send requests througth this proxy.
+    :param max_workers: (optional) Number of threads sending the batches of all the clients (default to 4).
+    :param priority_workers: (optional) Number of threads sending the batches of the priority lanes (default to 1).
+    :param encoding_processes: (optional) Number of processes serializing the batches.
+    :param keepalive_interval: (optional) Reopen the connections after this
+    many seconds of inactivity, before the server closes them.
+    """
+
+    sender_class = SyncSender
+
+    def __init__(self, base_url=None, proxy_url=None, max_workers=4, encoding_processes=None,
+                 keepalive_interval=None, priority_workers=1):
+        # type: (Optional[str], Optional[str], int, Optional[int], Optional[float], int) -> None
+        self.encoding_executor = None  # type: Optional[futures.ProcessPoolExecutor]
+        if encoding_processes:
+            self.encoding_executor = futures.ProcessPoolExecutor(max_workers=encoding_processes)
+        self.sender = self.sender_class(
+            base_url=base_url, proxy_url=proxy_url, max_pool_size=max_workers,
+            encoding_executor=self.encoding_executor)
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.queues = collections.OrderedDict()  # type: collections.OrderedDict[TenantExecutor, Deque[Job]]
+        self.queues_lock = threading.Lock()
+        self.priority_sender = self.sender_class(
+            base_url=base_url, proxy_url=proxy_url, max_pool_size=priority_workers,
+            encoding_executor=self.encoding_executor)
+        self.priority_executor = futures.ThreadPoolExecutor(max_workers=priority_workers)
+        if keepalive_interval is not None:
+            self.sender.start_keepalive(keepalive_interval)
+            self.priority_sender.start_keepalive(keepalive_interval)
+
+    def sender_for(self, headers, priority=False):
+        # type: (Mapping[str, str], bool) -> TenantSender
+        """Return a sender adding the headers of a client to the requests.
+
+        :param priority: (optional) Send the requests with the priority connections.
+        """
+        sender = self.priority_sender if priority else self.sender
+        return TenantSender(sender, headers=headers)
+
+    def executor_for(self, priority=False):  # type: (bool) -> TenantExecutor
+        """Return an executor whose jobs take turns with the other clients.
+
+        :param priority: (optional) Run the jobs on the priority worker
+        threads, ahead of the jobs taking turns.
+        """
+        return TenantExecutor(self, priority=priority)
+
+    def submit(self, tenant, fn, *args, **kwargs):
+        # type: (TenantExecutor, Callable[..., Any], *Any, **Any) -> futures.Future
+        """Queue a job of a client and schedule a worker to run it."""
+        future = futures.Future()  # type: futures.Future
+        with self.queues_lock:
+            queue = self.queues.get(tenant)
+            if queue is None:
+                queue = self.queues[tenant] = collections.deque()
+            queue.append((future, fn, args, kwargs))
+        self.executor.submit(self._run_next)
+        return future
+
+    def _run_next(self):  # type: () -> None
+        # Run the oldest job of the next client in turn, there is at least
+        # one queued job per scheduled call.
+        with self.queues_lock:
+            tenant, queue = next(iter(self.queues.items()))
+            future, fn, args, kwargs = queue.popleft()
+            del self.queues[tenant]
+            if queue:
+                self.queues[tenant] = queue
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def close(self):  # type: () -> None
+        """Wait for the queued batches to be sent and close the connections."""
+        self.priority_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+        self.priority_sender.close()
+        self.sender.close()
+        if self.encoding_executor is not None:
+            self.encoding_executor.shutdown(wait=True)
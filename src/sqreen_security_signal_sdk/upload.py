@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 - 2020 Sqreen. All rights reserved.
+# Please refer to our terms for more information:
+#
+#     https://www.sqreen.io/terms.html
+#
+"""Upload NDJSON signal archives to the Sqreen Ingestion service.
+
+Each line of the files is a signal or a trace in JSON, files ending with
+``.gz`` are decompressed on the fly.
+"""
+import argparse
+import functools
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .accumulator import BatchingAccumulator
+from .client import SyncClient
+from .exceptions import DataIngestionFailed
+from .sender import SyncSender
+from .utils import monotonic_ms
+
+if sys.version_info >= (3, 5):
+    from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+    from .compat_model import AnySignal, Batch
+    from .sender import BaseSender
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_signals(path, skip=0):  # type: (str, int) -> Iterator[Tuple[int, Optional[AnySignal]]]
+    """Yield the line number and the signal of each line of a file.
+
+    The first `skip` lines are not parsed, and None is yielded for the
+    lines which are not valid JSON.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as signals_file:  # type: ignore
+        for line_number, line in enumerate(signals_file, 1):
+            if line_number <= skip:
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line.decode("utf-8"))
+            except ValueError:
+                LOGGER.warning("%s:%d: invalid JSON, skipped", path, line_number)
+                yield line_number, None
+
+
+class BulkUploader(object):
+    """Upload signals read from NDJSON files with parallel connections.
+
+    The number of lines sent of each file is recorded in the checkpoint file,
+    uploading a file again resumes where the previous upload stopped. The
+    signals rejected by the Ingestion service are counted and appended to
+    the rejects file. Without a rejects file, the upload stops at the first
+    rejected signal, before the checkpoint moves past it.
+
+    :param sender: Sender of the batches, with a connection per worker.
+    :param max_batch_size: (optional) Maximum number of items sent per batch (default to 50).
+    :param max_workers: (optional) Number of batches sent in parallel (default to 4).
+    :param checkpoint_path: (optional) File recording the progress of the uploads.
+    :param rejects_path: (optional) File where the rejected signals are appended, one per line.
+    """
+
+    accumulator_class = BatchingAccumulator
+    # Interval in seconds between two progress reports and checkpoints.
+    report_interval = 10
+
+    def __init__(self, sender, max_batch_size=50, max_workers=4, checkpoint_path=None,
+                 rejects_path=None):
+        # type: (BaseSender, int, int, Optional[str], Optional[str]) -> None
+        self.sender = sender
+        self.sender.on_quarantine = self.reject
+        self.rejects_path = rejects_path
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = self.load_checkpoint()
+        self.lock = threading.Lock()
+        self.signals = 0
+        self.invalid = 0
+        self.failures = 0
+        self.rejected = 0
+        self.start_time = monotonic_ms()
+
+    def load_checkpoint(self):  # type: () -> Dict[str, int]
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save_checkpoint(self):  # type: () -> None
+        if self.checkpoint_path is None:
+            return
+        with self.lock:
+            data = json.dumps(self.checkpoint, indent=2, sort_keys=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            checkpoint_file.write(data)
+        getattr(os, "replace", os.rename)(tmp_path, self.checkpoint_path)
+
+    def reject(self, batch):  # type: (Batch) -> None
+        """Count the rejected signals and append them to the rejects file."""
+        lines = [self.sender.serialize_data(signal) + "\n" for signal in batch]
+        with self.lock:
+            self.rejected += len(batch)
+            if self.rejects_path is None:
+                raise DataIngestionFailed(
+                    "{} signal(s) rejected, set a rejects file to keep them".format(len(batch)))
+            with open(self.rejects_path, "ab") as rejects_file:
+                rejects_file.write("".join(lines).encode("utf-8"))
+
+    def iter_batches(self, path, skip=0):  # type: (str, int) -> Iterator[Tuple[int, Batch]]
+        """Yield the batches of signals read from a file with the number of
+        the last line they contain."""
+        accumulator = self.accumulator_class(max_batch_size=self.max_batch_size)
+        line_number = skip
+        for line_number, signal in read_signals(path, skip=skip):
+            if signal is None:
+                with self.lock:
+                    self.invalid += 1
+                continue
+            batch = accumulator.add(signal)
+            if batch:
+                yield line_number, batch
+        batch = accumulator.flush()
+        if batch:
+            yield line_number, batch
+
+    def upload(self, path):  # type: (str) -> bool
+        """Upload a file, return False if some batches could not be sent."""
+        key = os.path.abspath(path)
+        skip = self.checkpoint.get(key, 0)
+        if skip:
+            LOGGER.info("%s: resuming after line %d", path, skip)
+
+        # Batches are sent out of order, the checkpoint only moves past a
+        # batch once all the previous batches were sent.
+        sent = {}  # type: Dict[int, int]
+        next_index = [0]
+        failed = threading.Event()
+        in_flight = threading.BoundedSemaphore(self.max_workers * 2)
+
+        def batch_done(index, line_number, size, future):
+            # type: (int, int, int, Future) -> None
+            in_flight.release()
+            with self.lock:
+                if future.exception() is not None:
+                    LOGGER.error("%s: failed to send a batch before line %d: %r",
+                                 path, line_number, future.exception())
+                    self.failures += 1
+                    failed.set()
+                    return
+                self.signals += size
+                sent[index] = line_number
+                while next_index[0] in sent:
+                    self.checkpoint[key] = sent.pop(next_index[0])
+                    next_index[0] += 1
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        last_report = monotonic_ms()
+        try:
+            for index, (line_number, batch) in enumerate(self.iter_batches(path, skip=skip)):
+                in_flight.acquire()
+                if failed.is_set():
+                    break
+                future = executor.submit(self.sender.send_batch, batch)
+                future.add_done_callback(
+                    functools.partial(batch_done, index, line_number, len(batch)))
+                if monotonic_ms() - last_report >= self.report_interval * 1000:
+                    last_report = monotonic_ms()
+                    self.report()
+                    self.save_checkpoint()
+        finally:
+            executor.shutdown(wait=True)
+            self.save_checkpoint()
+        return not failed.is_set()
+
+    def report(self):  # type: () -> None
+        elapsed = (monotonic_ms() - self.start_time) / 1000.0
+        LOGGER.info("%d signals sent in %.1fs (%.0f signals/s), %d invalid, %d rejected, "
+                    "%d failed batches", self.signals, elapsed, self.signals / max(elapsed, 0.001),
+                    self.invalid, self.rejected, self.failures)
+
+    def run(self, paths):  # type: (Sequence[str]) -> bool
+        """Upload files one after the other, return False on the first failure."""
+        self.start_time = monotonic_ms()
+        try:
+            for path in paths:
+                if not self.upload(path):
+                    return False
+            return True
+        finally:
+            self.report()
+
+
+def main(argv=None):  # type: (Optional[List[str]]) -> int
+    parser = argparse.ArgumentParser(
+        prog="sqreen-signal-upload",
+        description="Upload NDJSON signal archives to the Sqreen Ingestion service.")
+    parser.add_argument("files", nargs="+", help="NDJSON files, optionally gzipped")
+    parser.add_argument("--token", required=True, help="application API token")
+    parser.add_argument("--app-name", help="application name")
+    parser.add_argument("--session-token", action="store_true",
+                        help="the token is a session token instead of an API token")
+    parser.add_argument("--base-url", help="ingestion API URL")
+    parser.add_argument("--proxy-url", help="send requests through this proxy")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="maximum number of signals per batch (default: 50)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of batches sent in parallel (default: 4)")
+    parser.add_argument("--checkpoint",
+                        help="file recording the progress to resume interrupted uploads")
+    parser.add_argument("--rejects",
+                        help="file where the signals rejected by the service are appended, "
+                             "without it the upload stops at the first rejected signal")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    headers = SyncClient.build_headers(
+        args.token, app_name=args.app_name, session_token=args.session_token)
+    sender = SyncSender(base_url=args.base_url, proxy_url=args.proxy_url,
+                        headers=headers, max_pool_size=args.workers)
+    uploader = BulkUploader(sender, max_batch_size=args.batch_size,
+                            max_workers=args.workers, checkpoint_path=args.checkpoint,
+                            rejects_path=args.rejects)
+    try:
+        return 0 if uploader.run(args.files) else 1
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
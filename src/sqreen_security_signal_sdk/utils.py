@@ -6,11 +6,14 @@
 #
 import codecs
 import datetime
+import itertools
 import json
 import sys
+import threading
+import time
 
 if sys.version_info >= (3, 5):
-    from typing import Mapping, Iterable
+    from typing import Any, Dict, Mapping, Iterable, Optional, Tuple
 
     string_type = str
 elif sys.version_info[0] >= 3:
@@ -51,12 +54,156 @@ def codecs_error_ascii_to_hex(exception):
 codecs.register_error("__sqreen_ascii_to_hex", codecs_error_ascii_to_hex)
 
 
+if sys.version_info[0] >= 3:
+    UTC = datetime.timezone.utc
+
+    def monotonic_ms():  # type: () -> int
+        """Current time of a monotonic clock in milliseconds."""
+        return int(time.monotonic() * 1000)
+
+else:
+    class _UTC(datetime.tzinfo):
+
+        def utcoffset(self, dt):
+            return datetime.timedelta(0)
+
+        def dst(self, dt):
+            return datetime.timedelta(0)
+
+        def tzname(self, dt):
+            return "UTC"
+
+    UTC = _UTC()
+
+    def monotonic_ms():  # type: () -> int
+        """Current time in milliseconds (no monotonic clock on Python 2)."""
+        return int(time.time() * 1000)
+
+
+class Deadline(object):
+    """Time limit shared by the requests of a sender, none until set."""
+
+    def __init__(self):  # type: () -> None
+        self.expires_at = None  # type: Optional[int]
+
+    def set(self, expires_at):  # type: (Optional[int]) -> None
+        """Set the monotonic time in milliseconds at which the deadline expires."""
+        self.expires_at = expires_at
+
+    def remaining(self):  # type: () -> Optional[float]
+        """Return the remaining time in seconds, None without deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0, self.expires_at - monotonic_ms()) / 1000.0
+
+    def expired(self):  # type: () -> bool
+        return self.expires_at is not None and monotonic_ms() >= self.expires_at
+
+
+class CoarseClock(object):
+    """Clock refreshed by a background thread at a fixed resolution.
+
+    Reading the clock is an attribute access instead of a system call, and
+    all the readings of a given second share the same datetime object.
+
+    :param resolution: (optional) Refresh interval in seconds (default to 10ms).
+    """
+
+    def __init__(self, resolution=0.01):  # type: (float) -> None
+        self.resolution = resolution
+        self.now_ms = 0
+        self.now_datetime = None  # type: Optional[datetime.datetime]
+        self._now_seconds = None  # type: Optional[int]
+        self._stopped = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+        self.refresh()
+
+    def __call__(self):  # type: () -> int
+        """Return the cached monotonic time in milliseconds."""
+        return self.now_ms
+
+    def utcnow(self):  # type: () -> datetime.datetime
+        """Return the cached UTC time, truncated to the second."""
+        assert self.now_datetime is not None
+        return self.now_datetime
+
+    def refresh(self):  # type: () -> None
+        """Update the cached times."""
+        self.now_ms = monotonic_ms()
+        now = int(time.time())
+        if now != self._now_seconds:
+            self._now_seconds = now
+            self.now_datetime = datetime.datetime.fromtimestamp(now, UTC)
+
+    def start(self):  # type: () -> None
+        """Start refreshing the clock in the background."""
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="sqreen-security-signal-clock")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):  # type: () -> None
+        """Stop refreshing the clock."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):  # type: () -> None
+        while not self._stopped.wait(self.resolution):
+            self.refresh()
+
+
+ISOFORMAT_CACHE_SIZE = 1024
+_isoformat_cache = {}  # type: Dict[Tuple[Optional[datetime.timedelta], datetime.datetime], str]
+
+
+def isoformat(dt):  # type: (datetime.datetime) -> str
+    """Format a datetime in ISO 8601.
+
+    Datetimes truncated to the second, such as the ones returned by
+    CoarseClock.utcnow, are formatted only once.
+    """
+    if dt.microsecond:
+        return dt.isoformat()
+    # Aware datetimes of different offsets compare equal when they are the
+    # same instant, the offset is part of the key. It comes first to never
+    # compare naive and aware datetimes, which raises on Python 2.
+    key = (dt.utcoffset(), dt)
+    formatted = _isoformat_cache.get(key)
+    if formatted is None:
+        if len(_isoformat_cache) >= ISOFORMAT_CACHE_SIZE:
+            _isoformat_cache.clear()
+        formatted = _isoformat_cache[key] = dt.isoformat()
+    return formatted
+
+
+class RawJSON(object):
+    """JSON document already encoded.
+
+    Senders embed it as is in the batches instead of encoding it again. It
+    can only be sent as a signal or trace, not nested in one.
+    """
+
+    def __init__(self, json):  # type: (str) -> None
+        self.json = json
+
+    def __repr__(self):  # type: () -> str
+        return "RawJSON({!r})".format(self.json)
+
+
 class CustomJSONEncoder(json.JSONEncoder):
     """Custom JsonEncoder which can handle datetime objects."""
 
     def default(self, obj):
         if isinstance(obj, datetime.datetime):
-            return obj.isoformat()
+            return isoformat(obj)
+        elif isinstance(obj, RawJSON):
+            # Only spliced as a whole signal by serialize_json, never decoded
+            # to be encoded again.
+            raise TypeError("RawJSON is only supported as a signal of a batch")
         elif isinstance(obj, bytes):
             return obj.decode("utf-8", errors="__sqreen_ascii_to_hex")
         else:
@@ -80,6 +227,62 @@ def reencode_payload(payload):
     return payload
 
 
+TRUNCATION_MARKER = u"<truncated>"
+
+
+def cap_payload(payload, max_string_length=None, max_items=None,
+                max_depth=None, reencode=False):
+    # type: (Any, Optional[int], Optional[int], Optional[int], bool) -> Tuple[Any, int]
+    """Limit the size of a payload, replacing the excess by truncation markers.
+
+    Strings are cut after max_string_length characters, containers keep their
+    first max_items items and containers nested more than max_depth levels
+    deep are replaced. When reencode is true, the payload is also reencoded
+    like reencode_payload does, in the same traversal.
+
+    Return the capped payload and the number of truncations.
+    """
+    truncations = [0]
+
+    def cap(value, depth):  # type: (Any, int) -> Any
+        if isinstance(value, (bytes, string_type)):
+            if reencode:
+                value = _reencode_string(value)
+            if max_string_length is not None and len(value) > max_string_length:
+                truncations[0] += 1
+                marker = TRUNCATION_MARKER  # type: Any
+                if isinstance(value, bytes):
+                    marker = marker.encode("utf-8")
+                return value[:max_string_length] + marker
+            return value
+        elif isinstance(value, (Mapping, Iterable)):
+            if max_depth is not None and depth >= max_depth:
+                truncations[0] += 1
+                return TRUNCATION_MARKER
+            if isinstance(value, Mapping):
+                items = iter(value.items())
+                result = {}
+                for key, item in itertools.islice(items, max_items):
+                    if reencode:
+                        key = _reencode_string(key)
+                    result[key] = cap(item, depth + 1)
+                dropped = sum(1 for _ in items)
+                if dropped:
+                    truncations[0] += 1
+                    result[TRUNCATION_MARKER] = dropped
+                return result
+            items = iter(value)
+            result_list = [cap(item, depth + 1) for item in itertools.islice(items, max_items)]
+            for _ in items:
+                truncations[0] += 1
+                result_list.append(TRUNCATION_MARKER)
+                break
+            return result_list
+        return value
+
+    return cap(payload, 0), truncations[0]
+
+
 def _reencode_string(string):
     """Ensure that the string is encodable into JSON."""
     if isinstance(string, bytes):
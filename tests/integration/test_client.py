@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sqreen_security_signal_sdk.client import Client
+from sqreen_security_signal_sdk.ingestion_server import IngestionServer
+from sqreen_security_signal_sdk.utils import monotonic_ms
+
+
+class ClientShutdownTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.tmp_dir, "spill.ndjson")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server_thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def start_server(self, latency):
+        self.server = IngestionServer(latency=latency)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def read_spill(self):
+        with open(self.spill_path) as spill_file:
+            return [json.loads(line)["signal_name"] for line in spill_file]
+
+    def wait_for_workers(self, client):
+        for lane in client.lanes.values():
+            lane.executor.shutdown(wait=True)
+
+    def test_close_bounds_requests(self):
+        self.start_server(latency=5)
+        client = Client(token="42", base_url=self.server.url, spill_path=self.spill_path)
+        client.point(signal_name="test", payload={})
+        start = monotonic_ms()
+        client.close(timeout=0.3)
+        self.wait_for_workers(client)
+        # The request is given up instead of waiting for the server.
+        self.assertLess(monotonic_ms() - start, 2000)
+        self.assertEqual(self.read_spill(), ["test"])
+
+    def test_close_without_duplicates(self):
+        self.start_server(latency=0.5)
+        client = Client(token="42", base_url=self.server.url, max_batch_size=1,
+                        spill_path=self.spill_path)
+        client.point(signal_name="test1", payload={})
+        client.point(signal_name="test2", payload={})
+        client.point(signal_name="test3", payload={})
+        # Let the first two requests start before closing.
+        time.sleep(0.1)
+        client.close(timeout=0.1)
+        self.wait_for_workers(client)
+        # The batches being sent at the deadline are delivered, not spilled.
+        self.assertEqual(self.server.signals, 2)
+        self.assertEqual(self.read_spill(), ["test3"])
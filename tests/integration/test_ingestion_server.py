@@ -0,0 +1,127 @@
+import json
+import logging
+import threading
+import time
+import unittest
+
+from sqreen_security_signal_sdk.client import Client
+from sqreen_security_signal_sdk.exceptions import AuthenticationFailed
+from sqreen_security_signal_sdk.ingestion_server import IngestionServer, percentile
+from sqreen_security_signal_sdk.loadgen import main
+from sqreen_security_signal_sdk.sender import SyncSender
+from sqreen_security_signal_sdk.utils import monotonic_ms
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class PercentileTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([42], 90), 42)
+        self.assertIsNone(percentile([], 50))
+
+
+class IngestionServerTestCase(unittest.TestCase):
+
+    def start_server(self, **kwargs):
+        self.server = IngestionServer(**kwargs)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        self.addCleanup(self.stop_server)
+
+    def stop_server(self):
+        self.server.shutdown()
+        self.server_thread.join()
+        self.server.server_close()
+
+    def test_endpoints(self):
+        self.start_server()
+        sender = SyncSender(base_url=self.server.url)
+        sent_at = time.time()
+        sender.send_batch([
+            {"signal_name": "test", "payload": {"sent_at": sent_at}},
+            {"signal_name": "test", "payload": {}},
+        ])
+        sender.send_signal({"signal_name": "test", "payload": {"sent_at": sent_at}})
+        sender.send_trace({"data": [{"signal_name": "test", "payload": {"sent_at": sent_at}}]})
+        sender.close()
+
+        stats = self.server.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["signals"], 4)
+        self.assertEqual(stats["errors"], {})
+        self.assertEqual(len(self.server.latencies), 3)
+        self.assertGreaterEqual(stats["latency_ms"]["p50"], 0)
+
+        self.server.reset()
+        self.assertEqual(self.server.stats()["requests"], 0)
+        self.assertIsNone(self.server.stats()["latency_ms"]["max"])
+
+    def test_errors(self):
+        self.start_server(error_rates={401: 1})
+        sender = SyncSender(base_url=self.server.url)
+        with self.assertRaises(AuthenticationFailed):
+            sender.send_signal({"signal_name": "test", "payload": {}})
+        sender.close()
+        self.assertEqual(self.server.stats()["errors"], {"401": 1})
+
+    def test_error_rates(self):
+        self.start_server(error_rates={500: 0.2, 422: 0.1}, seed=42)
+        for _ in range(1000):
+            self.server.process("/signals", b"{}")
+        errors = self.server.errors
+        self.assertEqual(self.server.requests, 1000)
+        self.assertAlmostEqual(errors[500], 200, delta=50)
+        self.assertAlmostEqual(errors[422], 100, delta=40)
+        self.assertEqual(self.server.signals, 1000 - errors[500] - errors[422])
+
+    def test_max_rate(self):
+        self.start_server(max_rate=100)
+        start = monotonic_ms()
+        for _ in range(3):
+            self.server.process("/batches", json.dumps([{}] * 10).encode("utf-8"))
+        self.assertGreaterEqual(monotonic_ms() - start, 250)
+
+    def test_client(self):
+        self.start_server(latency=0.01)
+        client = Client(token="42", base_url=self.server.url, max_batch_size=10)
+        for _ in range(25):
+            client.point(signal_name="test", payload={"sent_at": time.time()})
+        client.close()
+        stats = self.server.stats()
+        self.assertEqual(stats["signals"], 25)
+        self.assertEqual(stats["requests"], 3)
+        self.assertGreaterEqual(stats["latency_ms"]["max"], 10)
+
+    def test_loadgen(self):
+        self.start_server()
+        self.server.signals = 42
+        handler = RecordingHandler()
+        logger = logging.getLogger("sqreen_security_signal_sdk.loadgen")
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            self.assertEqual(main([
+                "--base-url", self.server.url, "--signals", "50", "--workers", "3",
+                "--batch-size", "20", "--interval", "0.1",
+            ]), 0)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(self.server.signals, 150)
+        output = "\n".join(record.getMessage() for record in handler.records)
+        self.assertIn("150 signals delivered", output)
+        self.assertIn("Delivery latency", output)
@@ -6,6 +6,7 @@ import unittest
 
 from sqreen_security_signal_sdk.exceptions import (AuthenticationFailed,
                                                    DataIngestionFailed,
+                                                   PayloadTooLarge,
                                                    UnexpectedStatusCode)
 from sqreen_security_signal_sdk.sender import SyncSender
 
@@ -43,6 +44,13 @@ class DataIngestionFailedHandler(server.BaseHTTPRequestHandler):
         self.end_headers()
 
 
+class PayloadTooLargeHandler(server.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.send_error(413)
+        self.end_headers()
+
+
 class UnexpectedFailureHandler(server.BaseHTTPRequestHandler):
 
     def do_POST(self):
@@ -57,6 +65,13 @@ class RetryFailureHandler(server.BaseHTTPRequestHandler):
         self.end_headers()
 
 
+class SlowIngestionHandler(FakeIngestionHandler):
+
+    def do_POST(self):
+        time.sleep(0.6)
+        return FakeIngestionHandler.do_POST(self)
+
+
 class FakeProxyHandler(FakeIngestionHandler):
 
     def do_POST(self):
@@ -108,6 +123,14 @@ class SyncSenderTestCase(unittest.TestCase):
         with self.assertRaises(DataIngestionFailed):
             s.send("/traces", {"data": {}})
 
+    def test_send_payload_too_large(self):
+        self.fake_server.RequestHandlerClass = PayloadTooLargeHandler
+        s = SyncSender(base_url=self.fake_server_url)
+        with self.assertRaises(PayloadTooLarge):
+            s.send("/traces", {"data": {}})
+        s.send_batch([{"data": {}}])
+        self.assertEqual(len(s.quarantine), 1)
+
     def test_send_unexpected_status(self):
         self.fake_server.RequestHandlerClass = UnexpectedFailureHandler
         s = SyncSender(base_url=self.fake_server_url)
@@ -120,6 +143,38 @@ class SyncSenderTestCase(unittest.TestCase):
         with self.assertRaises(Exception):
             s.send("/traces", {"data": {}})
 
+    def test_warm_up(self):
+        s = SyncSender(base_url=self.fake_server_url, max_pool_size=2)
+        s.warm_up()
+        pool = s.pool_manager.connection_from_url(self.fake_server_url)
+        self.assertEqual(pool.num_connections, 2)
+        s.warm_up()
+        self.assertEqual(pool.num_connections, 2)
+        s.close()
+
+    def test_keepalive(self):
+        s = SyncSender(base_url=self.fake_server_url)
+        pool = s.pool_manager.connection_from_url(self.fake_server_url)
+        s.start_keepalive(0.05)
+        time.sleep(0.3)
+        self.assertIsNot(
+            s.pool_manager.connection_from_url(self.fake_server_url), pool)
+        s.close()
+        self.assertIsNone(s._keepalive_thread)
+
+    def test_keepalive_in_flight(self):
+        self.fake_server.RequestHandlerClass = SlowIngestionHandler
+        s = SyncSender(base_url=self.fake_server_url,
+                       headers={"X-Test-Client": "hello"})
+        clears = []
+        clear = s.pool_manager.clear
+        s.pool_manager.clear = lambda: clears.append(1) or clear()
+        s.start_keepalive(0.1)
+        s.send_signal({"signal_name": "test"}, headers={"X-Test-Request": "world"})
+        # The connections are not reopened during the request.
+        self.assertEqual(clears, [])
+        s.close()
+
     def test_proxy(self):
         self.fake_server.RequestHandlerClass = FakeProxyHandler
         s = SyncSender(proxy_url=self.fake_server_url,
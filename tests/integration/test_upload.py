@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from sqreen_security_signal_sdk.upload import main
+
+if sys.version_info[0] >= 3:
+    from http import server
+    import socketserver
+else:
+    import BaseHTTPServer as server
+    import SocketServer as socketserver
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, server.HTTPServer):
+
+    daemon_threads = True
+
+
+class BatchIngestionHandler(server.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        assert self.path == "/batches"
+        assert self.headers.get("X-Api-Key") == "42"
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        batch = json.loads(body.decode("utf-8"))
+        if any(signal["payload"] == self.server.fail_on for signal in batch):
+            self.send_error(400)
+            self.end_headers()
+            return
+        if any(signal["payload"] in self.server.reject for signal in batch):
+            self.send_error(422)
+            self.end_headers()
+            return
+        with self.server.lock:
+            self.server.received.extend(batch)
+        self.send_response(202)
+        self.send_header("Content-Length", "2")
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UploadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fake_server = None
+        self.fake_server_thread = threading.Thread(target=self.run_fake_server)
+        self.fake_server_thread.start()
+        # Wait for the server to be ready
+        while getattr(self.fake_server, "fileno", None) is None:
+            time.sleep(0.1)
+
+    def tearDown(self):
+        self.fake_server.shutdown()
+        self.fake_server_thread.join()
+        self.fake_server.server_close()
+        self.fake_server = None
+        shutil.rmtree(self.tmp_dir)
+
+    def run_fake_server(self):
+        port = random.randint(25252, 32323)
+        fake_server = ThreadingHTTPServer(("localhost", port), BatchIngestionHandler)
+        fake_server.lock = threading.Lock()
+        fake_server.received = []
+        fake_server.fail_on = None
+        fake_server.reject = set()
+        self.fake_server_url = "http://localhost:{}/".format(port)
+        self.fake_server = fake_server
+        self.fake_server.serve_forever()
+
+    def write_signals(self, name, count, opener=open):
+        path = os.path.join(self.tmp_dir, name)
+        with opener(path, "wb") as signals_file:
+            for i in range(count):
+                signal = {"signal_name": "test", "payload": i}
+                signals_file.write(json.dumps(signal).encode("utf-8") + b"\n")
+            signals_file.write(b"\nnot json\n")
+        return path
+
+    def upload(self, *args):
+        return main([
+            "--token", "42", "--base-url", self.fake_server_url,
+            "--batch-size", "7", "--workers", "3",
+        ] + list(args))
+
+    def test_upload(self):
+        path = self.write_signals("signals.ndjson", 100)
+        gzip_path = self.write_signals("signals.ndjson.gz", 50, opener=gzip.open)
+        self.assertEqual(self.upload(path, gzip_path), 0)
+        received = sorted(signal["payload"] for signal in self.fake_server.received)
+        self.assertEqual(received, sorted(list(range(100)) + list(range(50))))
+
+    def test_resume(self):
+        path = self.write_signals("signals.ndjson", 100)
+        checkpoint_path = os.path.join(self.tmp_dir, "checkpoint.json")
+        self.fake_server.fail_on = 50
+        self.assertEqual(self.upload("--checkpoint", checkpoint_path, path), 1)
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(checkpoint[os.path.abspath(path)], 49)
+
+        self.fake_server.fail_on = None
+        self.fake_server.received = []
+        self.assertEqual(self.upload("--checkpoint", checkpoint_path, path), 0)
+        received = sorted(signal["payload"] for signal in self.fake_server.received)
+        self.assertEqual(received, list(range(49, 100)))
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(checkpoint[os.path.abspath(path)], 102)
+
+    def test_rejects(self):
+        path = self.write_signals("signals.ndjson", 300)
+        rejects_path = os.path.join(self.tmp_dir, "rejects.ndjson")
+        self.fake_server.reject = set(range(0, 300, 10))
+        self.assertEqual(self.upload("--rejects", rejects_path, path), 0)
+        received = sorted(signal["payload"] for signal in self.fake_server.received)
+        self.assertEqual(received, [i for i in range(300) if i % 10])
+        with open(rejects_path) as rejects_file:
+            rejected = sorted(json.loads(line)["payload"] for line in rejects_file)
+        self.assertEqual(rejected, list(range(0, 300, 10)))
+
+    def test_rejects_without_file(self):
+        path = self.write_signals("signals.ndjson", 100)
+        checkpoint_path = os.path.join(self.tmp_dir, "checkpoint.json")
+        self.fake_server.reject = {50}
+        self.assertEqual(self.upload("--checkpoint", checkpoint_path, path), 1)
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(checkpoint[os.path.abspath(path)], 49)
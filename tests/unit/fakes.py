@@ -0,0 +1,65 @@
+import json
+import threading
+
+from sqreen_security_signal_sdk.client import Client
+from sqreen_security_signal_sdk.sender import BaseSender
+from sqreen_security_signal_sdk.transport import SharedTransport
+
+
+class FakeSender(BaseSender):
+    """Sender recording the data and the headers of the requests instead of
+    sending them, waiting for ``unblocked`` first."""
+
+    def __init__(self, *args, **kwargs):
+        super(FakeSender, self).__init__(*args, **kwargs)
+        self.sent_data = []
+        self.sent_headers = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def send(self, endpoint, data, headers={}, **kwargs):
+        self.unblocked.wait()
+        if hasattr(self, "closed"):
+            raise RuntimeError
+        self.sent_data.append(data)
+        self.sent_headers.append(headers)
+
+    def sent_json(self):
+        """Return the recorded data as sent in JSON."""
+        return [json.loads(self.serialize_data(data)) for data in self.sent_data]
+
+    def warm_up(self):
+        self.warmed_up = True
+
+    def close(self, **kwargs):
+        self.closed = True
+
+
+class BlockingSender(FakeSender):
+    """Sender waiting for ``unblocked`` to be set, failing the batches
+    starting with a signal named ``bad``."""
+
+    def __init__(self, *args, **kwargs):
+        super(BlockingSender, self).__init__(*args, **kwargs)
+        self.unblocked.clear()
+
+    def send(self, endpoint, data, headers={}, **kwargs):
+        self.unblocked.wait()
+        if data[0].get("signal_name") == "bad":
+            raise RuntimeError
+        return super(BlockingSender, self).send(endpoint, data, headers=headers, **kwargs)
+
+
+class FakeClient(Client):
+
+    sender_class = FakeSender
+
+
+class BlockingClient(Client):
+
+    sender_class = BlockingSender
+
+
+class FakeTransport(SharedTransport):
+
+    sender_class = FakeSender
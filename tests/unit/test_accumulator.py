@@ -49,3 +49,14 @@ class BatchingAccumulatorTestCase(unittest.TestCase):
             s2 = Signal(signal_name="boom", payload={})
             ret = acc.add(s2)
             self.assertEqual(ret, Batch([s1, s2]))
+
+    def test_clock(self):
+        now = [0]
+        acc = BatchingAccumulator(max_batch_size=100, linger_time=0.300,
+                                  clock=lambda: now[0])
+        s1 = Signal(signal_name="test", payload={})
+        self.assertIsNone(acc.add(s1))
+        now[0] = 299
+        self.assertIsNone(acc.flush(soft=True))
+        now[0] = 300
+        self.assertEqual(acc.flush(soft=True), Batch([s1]))
@@ -0,0 +1,102 @@
+import unittest
+
+from sqreen_security_signal_sdk.accumulator import BatchingAccumulator
+from sqreen_security_signal_sdk.adaptive import AdaptiveBatchController
+from sqreen_security_signal_sdk.lanes import Lane
+
+from .fakes import BlockingSender
+
+
+class RecordingController(object):
+
+    def __init__(self):
+        self.observations = []
+
+    def observe(self, batch_size, latency, queue_depth):
+        self.observations.append(queue_depth)
+
+
+class AdaptiveBatchControllerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.acc = BatchingAccumulator(max_batch_size=50, linger_time=10)
+        self.controller = AdaptiveBatchController(
+            self.acc, min_batch_size=10, max_batch_size=200, min_linger_time=1,
+            max_linger_time=30, target_latency=1, max_delay=20)
+
+    def test_slow_sends(self):
+        self.controller.observe(50, 3, 0)
+        self.assertEqual(self.acc.max_batch_size, 25)
+        self.controller.observe(25, 3, 0)
+        self.controller.observe(12, 3, 0)
+        self.assertEqual(self.acc.max_batch_size, 10)
+
+    def test_backlog(self):
+        self.controller.observe(50, 0.5, 3)
+        self.assertEqual(self.acc.max_batch_size, 100)
+        self.controller.observe(100, 0.5, 3)
+        self.controller.observe(200, 0.5, 3)
+        self.assertEqual(self.acc.max_batch_size, 200)
+        # Partial batches do not grow.
+        self.acc.configure(max_batch_size=50, linger_time=10)
+        self.controller.observe(5, 0.5, 3)
+        self.assertEqual(self.acc.max_batch_size, 50)
+
+    def test_fast_sends(self):
+        self.controller.observe(50, 0.1, 0)
+        self.assertEqual(self.acc.max_batch_size, 60)
+        # Partial batches do not grow.
+        self.controller.observe(5, 0.1, 0)
+        self.assertEqual(self.acc.max_batch_size, 60)
+
+    def test_linger(self):
+        self.controller.observe(50, 2, 4)
+        self.assertEqual(self.acc.linger_ms, 10000)
+        self.controller = AdaptiveBatchController(
+            self.acc, min_linger_time=1, max_linger_time=30, max_delay=20)
+        self.controller.observe(5, 0.1, 0)
+        self.assertEqual(self.acc.linger_ms, 19900)
+        self.controller.observe(5, 10.1, 0)
+        self.assertEqual(self.acc.linger_ms, 16900)
+
+    def test_default_bounds(self):
+        acc = BatchingAccumulator(max_batch_size=1000, linger_time=120)
+        controller = AdaptiveBatchController(acc, target_latency=10)
+        controller.observe(1000, 0.1, 0)
+        self.assertEqual(acc.max_batch_size, 1000)
+        self.assertEqual(controller.max_linger_time, 120)
+        acc = BatchingAccumulator(max_batch_size=5)
+        controller = AdaptiveBatchController(acc, target_latency=0.1)
+        controller.observe(5, 1, 0)
+        self.assertEqual(acc.max_batch_size, 5)
+
+    def test_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveBatchController(self.acc, max_batch_size=20)
+        with self.assertRaises(ValueError):
+            AdaptiveBatchController(self.acc, min_linger_time=20)
+
+
+class LaneQueueDepthTestCase(unittest.TestCase):
+
+    def test_queue_depth(self):
+        sender = BlockingSender()
+        controller = RecordingController()
+        lane = Lane(sender, BatchingAccumulator(max_batch_size=1), max_workers=2,
+                    controller=controller)
+        for i in range(5):
+            lane.add({"signal_name": "test", "payload": i})
+        sender.unblocked.set()
+        lane.close()
+        # The batches being sent by the other worker are not counted.
+        self.assertEqual(max(controller.observations), 3)
+
+    def test_sync_flush(self):
+        sender = BlockingSender()
+        sender.unblocked.set()
+        controller = RecordingController()
+        lane = Lane(sender, BatchingAccumulator(max_batch_size=10), controller=controller)
+        lane.add({"signal_name": "test", "payload": {}})
+        lane.flush(sync=True)
+        self.assertEqual(controller.observations, [0])
+        lane.close()
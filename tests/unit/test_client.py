@@ -1,27 +1,11 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
-from sqreen_security_signal_sdk.client import Client
-from sqreen_security_signal_sdk.sender import BaseSender
-
-
-class FakeSender(BaseSender):
-
-    def __init__(self, *args, **kwargs):
-        super(FakeSender, self).__init__(*args, **kwargs)
-        self.sent_data = []
-
-    def send(self, endpoint, data, headers={}, **kwargs):
-        if hasattr(self, "closed"):
-            raise RuntimeError
-        self.sent_data.append(data)
-
-    def close(self, **kwargs):
-        self.closed = True
-
-
-class FakeClient(Client):
-
-    sender_class = FakeSender
+from .fakes import BlockingClient, FakeClient
 
 
 class ClientTestCase(unittest.TestCase):
@@ -88,3 +72,138 @@ class ClientTestCase(unittest.TestCase):
         client.close()
         with self.assertRaises(RuntimeError):
             client.trace({})
+
+    def test_clock(self):
+        client = FakeClient(token="42", max_batch_size=10, clock_resolution=0.01)
+        time = datetime.datetime(2020, 4, 14, 15, 3, 19)
+        client.point(signal_name="test", payload={})
+        client.point(signal_name="test", payload={}, time=time)
+        client.trace({})
+        self.assertIs(client.accumulator.clock, client.clock)
+        client.close()
+        signals = client.sender.sent_data[0]
+        self.assertIsNotNone(signals[0]["time"].utcoffset())
+        self.assertEqual(signals[0]["time"].microsecond, 0)
+        self.assertIs(signals[1]["time"], time)
+        self.assertIn("time", signals[2])
+
+        client = FakeClient(token="42", max_batch_size=1)
+        client.point(signal_name="test", payload={})
+        client.close()
+        self.assertNotIn("time", client.sender.sent_data[0][0])
+
+    def test_lanes(self):
+        client = FakeClient(token="42", max_batch_size=10, lanes={
+            "bulk": dict(max_batch_size=2, linger_time=60),
+        })
+        client.trace({})
+        client.trace({}, lane="bulk")
+        client.point(signal_name="attack", payload={}, lane="priority")
+        client.lanes["priority"].close()
+        self.assertEqual(len(client.sender.sent_data), 1)
+        self.assertEqual(client.sender.sent_data[0][0]["signal_name"], "attack")
+        self.assertNotIn("lane", client.sender.sent_data[0][0])
+
+        client.trace({}, lane="bulk")
+        client.lanes["bulk"].close()
+        self.assertEqual(len(client.sender.sent_data), 2)
+        self.assertEqual(len(client.sender.sent_data[1]), 2)
+
+        client.flush()
+        client.close()
+        self.assertEqual(len(client.sender.sent_data), 3)
+        self.assertEqual(client.sender.max_pool_size, 4)
+
+    def test_unknown_lane(self):
+        client = FakeClient(token="42")
+        with self.assertRaises(KeyError):
+            client.point(signal_name="test", payload={}, lane="unknown")
+        client.close()
+
+    def test_payload_limits(self):
+        client = FakeClient(token="42", max_batch_size=2,
+                            payload_limits=dict(max_string_length=3))
+        client.point(signal_name="test", payload={"foo": "abcdef"})
+        client.trace([{"signal_name": "test", "payload": "abcdef"}])
+        client.close()
+        self.assertEqual(len(client.sender.sent_data), 1)
+        self.assertEqual(client.truncations, 2)
+        signal, trace = client.sender.sent_data[0]
+        self.assertTrue(signal["payload"]["foo"].startswith("abc"))
+        self.assertTrue(trace["data"][0]["payload"].startswith("abc"))
+        self.assertEqual(signal["signal_name"], "test")
+
+    def test_unknown_payload_limits(self):
+        with self.assertRaises(ValueError):
+            FakeClient(token="42", payload_limits=dict(max_length=3))
+
+    def test_prewarm(self):
+        client = FakeClient(token="42", prewarm=True)
+        client.close()
+        self.assertTrue(client.sender.warmed_up)
+
+    def test_adaptive_batching(self):
+        client = FakeClient(token="42", max_batch_size=2, adaptive_batching=dict(
+            min_batch_size=2, max_batch_size=10, target_latency=10))
+        client.point(signal_name="test", payload={})
+        client.point(signal_name="test", payload={})
+        client.lanes["default"].executor.shutdown(wait=True)
+        self.assertEqual(client.accumulator.max_batch_size, 10)
+        client.close()
+
+    def test_close_flush(self):
+        client = FakeClient(token="42", max_batch_size=10)
+        client.point(signal_name="test", payload={})
+        client.trace({}, lane="priority")
+        client.close()
+        self.assertEqual(len(client.sender.sent_data), 2)
+
+
+class ClientShutdownTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.tmp_dir, "spill.ndjson")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_spill(self):
+        with open(self.spill_path) as spill_file:
+            return [json.loads(line) for line in spill_file]
+
+    def test_close_timeout(self):
+        client = BlockingClient(token="42", max_batch_size=1, spill_path=self.spill_path)
+        client.point(signal_name="test1", payload={})
+        client.point(signal_name="test2", payload={})
+        client.point(signal_name="test3", payload={})
+        client.close(timeout=0.1)
+        # The batch waiting for a worker is spilled right away.
+        spilled = self.read_spill()
+        self.assertEqual([signal["signal_name"] for signal in spilled], ["test3"])
+        # The batches being sent are spilled once they fail.
+        client.sender.unblocked.set()
+        for lane in client.lanes.values():
+            lane.executor.shutdown(wait=True)
+        spilled = self.read_spill()
+        self.assertEqual(
+            sorted(signal["signal_name"] for signal in spilled),
+            ["test1", "test2", "test3"])
+
+    def test_close_failure(self):
+        client = BlockingClient(token="42", max_batch_size=10, spill_path=self.spill_path)
+        client.sender.unblocked.set()
+        client.point(signal_name="bad", payload={})
+        client.point(signal_name="test", payload={}, lane="priority")
+        client.close(timeout=1)
+        self.assertEqual(len(client.sender.sent_data), 1)
+        spilled = self.read_spill()
+        self.assertEqual(len(spilled), 1)
+        self.assertEqual(spilled[0]["signal_name"], "bad")
+
+    def test_close_without_spill(self):
+        client = BlockingClient(token="42", max_batch_size=10)
+        client.point(signal_name="test", payload={})
+        client.close(timeout=0)
+        client.sender.unblocked.set()
+        self.assertFalse(os.path.exists(self.spill_path))
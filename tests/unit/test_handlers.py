@@ -0,0 +1,100 @@
+import logging
+import threading
+import unittest
+
+from sqreen_security_signal_sdk.handlers import SignalHandler
+
+from .fakes import FakeClient
+
+
+class SignalHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient(token="42", max_batch_size=10)
+        self.logger = logging.getLogger("test_handlers")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_records(self):
+        handler = SignalHandler(self.client, "sq.test.log", interval=0.01)
+        self.logger.addHandler(handler)
+        try:
+            self.logger.info("hello %s", "world", extra={"signal_context": {"ip": "::1"}})
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                self.logger.exception("failed")
+            self.logger.debug("ignored")
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.client.close()
+
+        signals = [signal for batch in self.client.sender.sent_data for signal in batch]
+        self.assertEqual(len(signals), 2)
+        self.assertEqual(signals[0]["signal_name"], "sq.test.log")
+        self.assertEqual(signals[0]["type"], "point")
+        self.assertEqual(signals[0]["payload"]["message"], "hello world")
+        self.assertEqual(signals[0]["payload"]["level"], "INFO")
+        self.assertEqual(signals[0]["context"], {"ip": "::1"})
+        self.assertIsNotNone(signals[0]["time"].utcoffset())
+        self.assertIn("ValueError: boom", signals[1]["payload"]["exception"])
+        self.assertNotIn("context", signals[1])
+
+    def test_full_queue(self):
+        handler = SignalHandler(self.client, "sq.test.log", max_queue_size=3, interval=60)
+        self.logger.addHandler(handler)
+        try:
+            for i in range(5):
+                self.logger.info("message %d", i)
+            self.assertEqual(handler.dropped, 2)
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.client.close()
+        self.assertEqual(len(self.client.sender.sent_data[0]), 3)
+
+    def test_concurrent_logging(self):
+        handler = SignalHandler(self.client, "sq.test.log", interval=0.001)
+        self.logger.addHandler(handler)
+
+        def log():
+            for i in range(200):
+                self.logger.info("message %d", i)
+
+        threads = [threading.Thread(target=log) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.logger.removeHandler(handler)
+        handler.close()
+        self.client.close()
+        self.assertEqual(sum(len(batch) for batch in self.client.sender.sent_data), 800)
+
+    def test_closed_client(self):
+        handler = SignalHandler(self.client, "sq.test.log", interval=0.01)
+        self.logger.addHandler(handler)
+        self.client.close()
+        try:
+            for i in range(5):
+                self.logger.info("message %d", i)
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(handler.dropped, 5)
+        self.assertEqual(self.client.sender.sent_data, [])
+
+    def test_sdk_loggers(self):
+        handler = SignalHandler(self.client, "sq.test.log", interval=60)
+        logger = logging.getLogger("sqreen_security_signal_sdk.sender")
+        logger.addHandler(handler)
+        try:
+            logger.warning("1 signal(s) rejected by the ingestion service")
+            self.assertEqual(len(handler.queue), 0)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
@@ -1,9 +1,38 @@
 # -*- coding: utf-8 -*-
 import datetime
 import json
+import threading
 import unittest
+from concurrent.futures import Future, ProcessPoolExecutor
 
-from sqreen_security_signal_sdk.sender import Sender
+from sqreen_security_signal_sdk.accumulator import BatchingAccumulator
+from sqreen_security_signal_sdk.compat_model import Batch
+from sqreen_security_signal_sdk.exceptions import (BatchPartiallySent,
+                                                   DataIngestionFailed,
+                                                   PayloadTooLarge,
+                                                   UnexpectedStatusCode)
+from sqreen_security_signal_sdk.lanes import Lane
+from sqreen_security_signal_sdk.sender import BaseSender, Sender
+from sqreen_security_signal_sdk.utils import RawJSON
+
+
+class RejectingSender(BaseSender):
+
+    def __init__(self, *args, **kwargs):
+        super(RejectingSender, self).__init__(*args, **kwargs)
+        self.requests = []
+        self.sent_data = []
+
+    def send(self, endpoint, data, headers={}, **kwargs):
+        self.requests.append(data)
+        for item in data:
+            if item["signal_name"] == "bad":
+                raise DataIngestionFailed
+            if item["signal_name"] == "huge":
+                raise PayloadTooLarge
+            if item["signal_name"] == "flaky":
+                raise UnexpectedStatusCode(500)
+        self.sent_data.extend(data)
 
 
 class SenderJSONEncoderTestCase(unittest.TestCase):
@@ -32,6 +61,16 @@ class SenderJSONEncoderTestCase(unittest.TestCase):
         result = json.loads(Sender().serialize_data(data))
         self.assertEqual(expected, result)
 
+    def test_raw_json(self):
+        data = Batch([
+            {"signal_name": "test", "payload": {}},
+            RawJSON('{"data":[]}'),
+        ])
+        result = json.loads(Sender().serialize_data(data))
+        self.assertEqual(result, [{"signal_name": "test", "payload": {}}, {"data": []}])
+        with self.assertRaises(TypeError):
+            Sender().serialize_data({"nested": RawJSON("[1]")})
+
     def test_repr(self):
         obj = object()
         data = {
@@ -44,3 +83,108 @@ class SenderJSONEncoderTestCase(unittest.TestCase):
         }
         result = json.loads(Sender().serialize_data(data))
         self.assertEqual(expected, result)
+
+
+class SenderEncodingExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ProcessPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def test_serialize(self):
+        data = Batch([{
+            "signal_name": b"\xe9",
+            "payload": {"time": datetime.datetime(2020, 4, 14, 15, 3, 19)}
+        }])
+        sender = Sender(encoding_executor=self.executor)
+        self.assertEqual(sender.serialize_data(data), Sender().serialize_data(data))
+
+    def test_unpicklable(self):
+        data = {
+            "signal_name": "test",
+            "payload": {"lock": threading.Lock()}
+        }
+        sender = Sender(encoding_executor=self.executor)
+        result = json.loads(sender.serialize_data(data))
+        self.assertEqual(result["payload"]["lock"], repr(data["payload"]["lock"]))
+
+    def test_timeout(self):
+        class PendingExecutor(object):
+            def submit(self, fn, *args, **kwargs):
+                return Future()
+
+        sender = Sender(encoding_executor=PendingExecutor())
+        sender.encoding_timeout = 0.01
+        data = {"signal_name": "test", "payload": {}}
+        self.assertEqual(sender.serialize_data(data), Sender().serialize_data(data))
+
+
+class SenderBatchSplittingTestCase(unittest.TestCase):
+
+    def test_isolate_rejected_signals(self):
+        sender = RejectingSender()
+        batch = Batch(
+            {"signal_name": "good{}".format(i), "payload": {}} for i in range(8))
+        batch[2]["signal_name"] = "bad"
+        batch[7]["signal_name"] = "huge"
+        sender.send_batch(batch)
+        self.assertEqual(len(sender.sent_data), 6)
+        self.assertEqual(
+            [item["signal_name"] for item in sender.quarantine], ["bad", "huge"])
+        self.assertTrue(all(isinstance(data, Batch) for data in sender.requests))
+
+    def test_partial_failure(self):
+        sender = RejectingSender()
+        batch = Batch({"signal_name": name, "payload": {}} for name in "abcdefgh")
+        batch[1]["signal_name"] = "bad"
+        batch[2]["signal_name"] = "flaky"
+        with self.assertRaises(BatchPartiallySent) as context:
+            sender.send_batch(batch)
+        self.assertEqual(
+            [item["signal_name"] for item in context.exception.batch], ["flaky", "d"])
+        self.assertIsInstance(context.exception.error, UnexpectedStatusCode)
+        self.assertEqual(
+            sorted(item["signal_name"] for item in sender.sent_data), ["a", "e", "f", "g", "h"])
+        self.assertEqual([item["signal_name"] for item in sender.quarantine], ["bad"])
+
+    def test_lane_partial_failure(self):
+        sender = RejectingSender()
+        lane = Lane(sender, BatchingAccumulator(max_batch_size=10))
+        for name in ("a", "bad", "flaky", "d"):
+            lane.add({"signal_name": name, "payload": {}})
+        undelivered = lane.close()
+        self.assertEqual(
+            [[item["signal_name"] for item in batch] for batch in undelivered], [["flaky", "d"]])
+
+    def test_rejected_batch(self):
+        sender = RejectingSender()
+        sender.send_batch(Batch({"signal_name": "bad", "payload": i} for i in range(50)))
+        self.assertEqual(len(sender.requests), 3)
+        self.assertEqual(len(sender.quarantine), 50)
+
+    def test_split_depth(self):
+        sender = RejectingSender()
+        sender.max_split_depth = 1
+        batch = Batch({"signal_name": "good{}".format(i), "payload": {}} for i in range(8))
+        batch[0]["signal_name"] = "bad"
+        sender.send_batch(batch)
+        self.assertEqual(len(sender.requests), 3)
+        self.assertEqual(len(sender.sent_data), 4)
+        self.assertEqual(len(sender.quarantine), 4)
+
+    def test_no_splitting(self):
+        sender = RejectingSender()
+        sender.split_rejected_batches = False
+        with self.assertRaises(DataIngestionFailed):
+            sender.send_batch(Batch([{"signal_name": "bad", "payload": {}}]))
+        self.assertEqual(len(sender.quarantine), 0)
+
+    def test_quarantine_size(self):
+        sender = RejectingSender()
+        sender.send_batch(Batch(
+            {"signal_name": "bad", "payload": i}
+            for i in range(sender.max_quarantine_size + 1)))
+        self.assertEqual(len(sender.quarantine), sender.max_quarantine_size)
+        self.assertEqual(len(sender.sent_data), 0)
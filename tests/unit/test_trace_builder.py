@@ -0,0 +1,59 @@
+import unittest
+
+from .fakes import FakeClient
+
+
+class TraceBuilderTestCase(unittest.TestCase):
+
+    def test_trace(self):
+        client = FakeClient(token="42", max_batch_size=2)
+        client.point(signal_name="before", payload={})
+        with client.trace_builder(actor={"ip": "::1"}) as trace:
+            trace.point(signal_name="test1", payload={"foo": b"bar"})
+            trace.metric(signal_name="test2", payload=42, actor="me")
+        client.close()
+
+        self.assertEqual(len(client.sender.sent_json()), 1)
+        signal, trace = client.sender.sent_json()[0]
+        self.assertEqual(signal["signal_name"], "before")
+        self.assertEqual(trace["actor"], {"ip": "::1"})
+        self.assertEqual(trace["data"], [
+            {"signal_name": "test1", "payload": {"foo": "bar"}, "type": "point"},
+            {"signal_name": "test2", "payload": 42, "type": "metric", "actor": "me"},
+        ])
+
+    def test_empty_trace(self):
+        client = FakeClient(token="42")
+        client.trace_builder(lane="priority").finish()
+        client.close()
+        self.assertEqual(client.sender.sent_json(), [[{"data": []}]])
+
+    def test_overflow(self):
+        client = FakeClient(token="42", payload_limits=dict(max_string_length=10))
+        trace = client.trace_builder(max_signals=3, max_size=200)
+        trace.point(signal_name="small", payload="x" * 100)
+        trace.point(signal_name="big", payload=list(range(100)))
+        for _ in range(3):
+            trace.point(signal_name="small", payload={})
+        trace.finish()
+        with self.assertRaises(RuntimeError):
+            trace.point(signal_name="late", payload={})
+        client.close()
+
+        data = client.sender.sent_json()[0][0]["data"]
+        self.assertEqual(len(data), 4)
+        self.assertEqual(len(data[0]["payload"]), 10 + len("<truncated>"))
+        self.assertEqual(client.truncations, 1)
+        overflow = data[-1]
+        self.assertEqual(overflow["signal_name"], trace.overflow_signal_name)
+        self.assertEqual(overflow["payload"], {
+            "dropped": 2, "signal_names": {"big": 1, "small": 1}})
+
+    def test_clock(self):
+        client = FakeClient(token="42", clock_resolution=0.01)
+        client.trace_builder().finish()
+        client.trace_builder(time="2020-04-14T15:03:19Z").finish()
+        client.close()
+        first, second = client.sender.sent_json()[0]
+        self.assertIn("time", first)
+        self.assertEqual(second["time"], "2020-04-14T15:03:19Z")
@@ -0,0 +1,102 @@
+import threading
+import unittest
+from concurrent import futures
+
+from sqreen_security_signal_sdk.client import Client
+
+from .fakes import FakeTransport
+
+
+class SharedTransportTestCase(unittest.TestCase):
+
+    def test_headers(self):
+        transport = FakeTransport(max_workers=2)
+        client1 = Client(token="42", app_name="app1", max_batch_size=1, transport=transport)
+        client2 = Client(token="43", session_token=True, max_batch_size=1, transport=transport)
+        client1.point(signal_name="test1", payload={})
+        client2.point(signal_name="test2", payload={})
+        client1.close()
+        client2.close()
+        self.assertFalse(hasattr(transport.sender, "closed"))
+        transport.close()
+        self.assertTrue(transport.sender.closed)
+
+        sent = {
+            data[0]["signal_name"]: headers
+            for headers, data in zip(transport.sender.sent_headers, transport.sender.sent_data)
+        }
+        self.assertEqual(sent["test1"]["X-Api-Key"], "42")
+        self.assertEqual(sent["test1"]["X-App-Name"], "app1")
+        self.assertEqual(sent["test2"]["X-Session-Key"], "43")
+        self.assertNotIn("X-Api-Key", sent["test2"])
+
+    def test_fairness(self):
+        transport = FakeTransport(max_workers=1)
+        transport.sender.unblocked.clear()
+        busy = Client(token="42", max_batch_size=1, transport=transport)
+        quiet = Client(token="43", max_batch_size=1, transport=transport)
+        for i in range(5):
+            busy.point(signal_name="busy", payload=i)
+        quiet.point(signal_name="quiet", payload={})
+        transport.sender.unblocked.set()
+        busy.close()
+        quiet.close()
+        transport.close()
+
+        names = [data[0]["signal_name"] for data in transport.sender.sent_data]
+        self.assertEqual(len(names), 6)
+        self.assertLessEqual(names.index("quiet"), 2)
+
+    def test_closed_client(self):
+        transport = FakeTransport()
+        client = Client(token="42", max_batch_size=1, transport=transport)
+        client.close()
+        with self.assertRaises(RuntimeError):
+            client.point(signal_name="test", payload={})
+        transport.close()
+
+    def test_priority_lane(self):
+        transport = FakeTransport(max_workers=1)
+        transport.sender.unblocked.clear()
+        busy = Client(token="42", max_batch_size=1, transport=transport)
+        client = Client(token="43", max_batch_size=1, transport=transport)
+        try:
+            for i in range(5):
+                busy.point(signal_name="busy", payload=i)
+            client.point(signal_name="urgent", payload={}, lane="priority")
+            futures.wait(client.lanes["priority"].drain())
+            # Sent while the shared workers are all busy.
+            priority_sender = transport.priority_sender
+            self.assertEqual(
+                [data[0]["signal_name"] for data in priority_sender.sent_data], ["urgent"])
+            self.assertEqual(priority_sender.sent_headers[0]["X-Api-Key"], "43")
+            self.assertEqual(transport.sender.sent_data, [])
+        finally:
+            transport.sender.unblocked.set()
+            busy.close()
+            client.close()
+        self.assertFalse(hasattr(priority_sender, "closed"))
+        transport.close()
+        self.assertTrue(priority_sender.closed)
+
+    def test_shared_priority_lanes(self):
+        transport = FakeTransport(max_workers=2)
+        threads = threading.active_count()
+        clients = [Client(token=str(i), transport=transport) for i in range(20)]
+        for client in clients:
+            client.point(signal_name="urgent", payload={}, lane="priority")
+            self.assertIs(client.lanes["priority"].sender.sender, transport.priority_sender)
+        for client in clients:
+            client.close()
+        self.assertEqual(len(transport.priority_sender.sent_data), 20)
+        # Only the worker threads of the transport.
+        self.assertLessEqual(threading.active_count(), threads + 3)
+        transport.close()
+
+    def test_transport_options(self):
+        transport = FakeTransport()
+        with self.assertRaises(ValueError):
+            Client(token="42", transport=transport, base_url="http://localhost/")
+        with self.assertRaises(ValueError):
+            Client(token="42", transport=transport, keepalive_interval=10)
+        transport.close()
@@ -2,9 +2,12 @@
 import datetime
 import json
 import sys
+import time
 import unittest
 
-from sqreen_security_signal_sdk.utils import (CustomJSONEncoder,
+from sqreen_security_signal_sdk.utils import (TRUNCATION_MARKER, UTC,
+                                              CoarseClock, CustomJSONEncoder,
+                                              cap_payload, isoformat,
                                               reencode_payload)
 
 
@@ -22,6 +25,33 @@ class JSONTestCase(unittest.TestCase):
             json.dumps(date, cls=CustomJSONEncoder), '"%s"' % date.isoformat()
         )
 
+    def test_datetime_second(self):
+        date = datetime.datetime(2020, 4, 14, 15, 3, 19)
+
+        self.assertEqual(isoformat(date), "2020-04-14T15:03:19")
+        self.assertIs(isoformat(date), isoformat(date))
+        self.assertEqual(
+            isoformat(date.replace(microsecond=42)), "2020-04-14T15:03:19.000042"
+        )
+
+    def test_datetime_timezones(self):
+        class PlusOne(datetime.tzinfo):
+            def utcoffset(self, dt):
+                return datetime.timedelta(hours=1)
+
+            def dst(self, dt):
+                return datetime.timedelta(0)
+
+        naive = datetime.datetime(2020, 1, 1, 12)
+        utc = datetime.datetime(2020, 1, 1, 12, tzinfo=UTC)
+        plus_one = datetime.datetime(2020, 1, 1, 13, tzinfo=PlusOne())
+        self.assertEqual(isoformat(naive), "2020-01-01T12:00:00")
+        self.assertEqual(
+            json.dumps(utc, cls=CustomJSONEncoder), '"2020-01-01T12:00:00+00:00"')
+        self.assertEqual(
+            json.dumps(plus_one, cls=CustomJSONEncoder), '"2020-01-01T13:00:00+01:00"')
+        self.assertEqual(isoformat(utc), "2020-01-01T12:00:00+00:00")
+
     def test_abstract_repr(self):
         class MyClass(object):
             def __repr__(self):
@@ -63,3 +93,63 @@ class JSONTestCase(unittest.TestCase):
 
     def test_reencode_other(self):
         self.assertEqual(reencode_payload(42), 42)
+
+
+class CapPayloadTestCase(unittest.TestCase):
+
+    def test_no_limits(self):
+        payload = {"foo": ["bar", {"baz": "x" * 1000}], "qux": 42}
+        self.assertEqual(cap_payload(payload), (payload, 0))
+
+    def test_string_length(self):
+        payload, truncations = cap_payload(
+            {"foo": "abcdef", "bar": b"abcdef", "baz": "abc"}, max_string_length=3)
+        self.assertEqual(payload["foo"], "abc" + TRUNCATION_MARKER)
+        self.assertEqual(payload["bar"], b"abc" + TRUNCATION_MARKER.encode("utf-8"))
+        self.assertEqual(payload["baz"], "abc")
+        self.assertEqual(truncations, 2)
+
+    def test_items(self):
+        payload, truncations = cap_payload(
+            {"foo": list(range(10)), "bar": iter(range(3))}, max_items=3)
+        self.assertEqual(payload["foo"], [0, 1, 2, TRUNCATION_MARKER])
+        self.assertEqual(payload["bar"], [0, 1, 2])
+        self.assertEqual(truncations, 1)
+
+        payload, truncations = cap_payload(
+            {str(i): i for i in range(5)}, max_items=2)
+        self.assertEqual(len(payload), 3)
+        self.assertEqual(payload[TRUNCATION_MARKER], 3)
+        self.assertEqual(truncations, 1)
+
+    def test_depth(self):
+        payload, truncations = cap_payload(
+            {"a": {"b": {"c": {}}, "d": [[1]]}}, max_depth=2)
+        self.assertEqual(
+            payload, {"a": {"b": TRUNCATION_MARKER, "d": TRUNCATION_MARKER}})
+        self.assertEqual(truncations, 2)
+
+    def test_reencode(self):
+        payload, truncations = cap_payload(
+            {b"foo": [b"bar\xe9"]}, reencode=True)
+        self.assertEqual(payload, {u"foo": [u"bar\\xe9"]})
+        self.assertEqual(truncations, 0)
+
+
+class CoarseClockTestCase(unittest.TestCase):
+
+    def test_refresh(self):
+        clock = CoarseClock(resolution=0.001)
+        before = clock()
+        now = clock.utcnow()
+        self.assertEqual(now.microsecond, 0)
+        self.assertIsNotNone(now.utcoffset())
+        clock.start()
+        try:
+            time.sleep(0.05)
+            self.assertGreater(clock(), before)
+        finally:
+            clock.stop()
+        stopped = clock()
+        time.sleep(0.01)
+        self.assertEqual(clock(), stopped)